@@ -9,6 +9,7 @@
 
 from picodaqa.mpBDisplay import mpBDisplay
 from picodaqa.mpHists import mpHists
+from picodaqa.sharedHists import sharedHists
 
 # import analysis code as library
 from pulseFilter import *
@@ -34,20 +35,20 @@ if 'RMeter' in pFmodules:
           args=(filtRateQ, 12., 2500., 'muon rate history') ) )
 #               mp.Queue  rate  update interval          
 
-histQ = None
+hists = None
 if 'Hists' in pFmodules:
-  histQ = mp.Queue(1) # information queue for Filter
-#  book histograms and start histogrammer
+#  book histograms in shared memory and start histogrammer
   Hdescriptors = []
   Hdescriptors.append([0., 0.4, 50, 20., 'noise Trg. Pulse (V)', 0] )
 #                   min max nbins ymax    title               lin/log
   Hdescriptors.append([0., 0.8, 50, 15., 'valid Trg. Pulse (V)', 0] )
   Hdescriptors.append([0., 0.8, 50, 15., 'Pulse height (V)', 0] )
   Hdescriptors.append([0., 15., 45, 7.5, 'Tau (µs)', 1] )
+  hists = sharedHists(Hdescriptors) # filled by Filter
   procs.append(mp.Process(name='Hists',
           target = mpHists, 
-          args=(histQ, Hdescriptors, 2000., 'Filter Histograms') ) )
-#             data Queue, Hist.Desrc  interval    
+          args=(hists, Hdescriptors, 2000., 'Filter Histograms') ) )
+#             shared hists, Hist.Desrc  interval    
 
 VSigQ = None
 if 'Display' in pFmodules:
@@ -64,15 +65,15 @@ cId = BM.BMregister() # get a Buffer Manager Client Id
 
   # pulse analysis as thread
 #thrds.append(threading.Thread(target=pulseFilter,
-#      args = ( BM, PSconf, cId, filtRateQ, histQ, VSigQ, True, 1) ) )
-#                      BMclientId  RMeterQ  histQ  fileout verbose    
+#      args = ( BM, PSconf, cId, filtRateQ, hists, VSigQ, True, 1) ) )
+#                      BMclientId  RMeterQ  hists  fileout verbose    
 
   # pulse analysis as sub-process
 procs.append(mp.Process(name='pulseFilter', target=pulseFilter, 
-       args = ( BM, cId, pFconfdict, filtRateQ, histQ, VSigQ, True, 1) ) )
-#              BMclientId  config    RMeterQ  histQ  fileout verbose    
+       args = ( BM, cId, pFconfdict, filtRateQ, hists, VSigQ, True, 1) ) )
+#              BMclientId  config    RMeterQ  hists  fileout verbose    
 
 #   could also run this in main thread
-#pulseFilter( BM, PSconf, cId, filtRateQ, histQ, VSigQ, True, 1)  
+#pulseFilter( BM, PSconf, cId, filtRateQ, hists, VSigQ, True, 1)  
 
 # <<< - end of inserted code
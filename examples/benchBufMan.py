@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# script benchBufMan.py
+'''
+  **benchBufMan** throughput and latency of BufferMan
+
+  runs BufferMan with a synthetic data producer (no hardware needed)
+  for all combinations of the parameters given in a configuration
+  file (default: benchBufMan.yaml) and measures for each setting
+
+    - sustained event rate and life fraction of the producer
+    - p50 / p99 of the hand-off latency (producer -> consumer)
+      for obligatory, random and mpQ consumers
+    - CPU time per process (producer, manageDataBuffer, consumers)
+
+  results are written to a json file (default: benchBufMan_<date>.json)
+  for comparison between versions of picodaqa
+
+  usage: python3 benchBufMan.py [<config>.yaml] [<output>.json]
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import sys, os, time, json, itertools, platform, threading
+import yaml, numpy as np
+import multiprocessing as mp
+
+import picodaqa
+import picodaqa.BufferMan as BMan
+
+class SynthDevice(object):
+  '''synthetic data producer with the interface of picoConfig.PSconfig'''
+
+  def __init__(self, NChannels, NSamples, rate=0., NCaptures=1):
+    self.NChannels = NChannels
+    self.NSamples = NSamples
+    self.TSampling = 1E-8
+    self.NCaptures = NCaptures
+    self.OscConfDict = {}
+    self.rawScale = [1./32512] * NChannels # for raw data in buffer
+    self.rawOffset = [0.] * NChannels
+    self.rate = rate   # trigger rate, 0. for maximum rate
+    self.tnext = 0.    # time of next trigger
+    self.n = 0
+
+  def setBufferManagerPointer(self, BM):
+    self.BM = BM
+
+  def _wait(self):
+    # wait for next trigger, fixed rate
+    if self.rate > 0.:
+      t = time.time()
+      self.tnext = max(self.tnext + 1./self.rate, t)
+      if self.tnext > t: time.sleep(self.tnext - t)
+    self.n += 1
+
+  def acquireDataBM(self, buffer):
+    ti = time.time()
+    self._wait()
+    buffer[:] = self.n % 1000 # touch all samples as a device would
+    t = time.time()
+    return t, t - ti
+
+  def acquireDataBMbulk(self, buffers):
+    ti = time.time()
+    ttrgs = []
+    for b in buffers:
+      self._wait()
+      b[:] = self.n % 1000
+      ttrgs.append(time.time())
+    return ttrgs, time.time() - ti
+
+def cpuTime(pid=None):
+  '''CPU time (user + system) of a process, from /proc if pid given'''
+  if pid is None:
+    t = os.times()
+    return t[0] + t[1]
+  try:
+    with open('/proc/%i/stat' % pid) as f:
+      fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12]))/os.sysconf('SC_CLK_TCK')
+  except (IOError, OSError, ValueError):
+    return None
+
+def consumer(BM, kind, cid, Q, tProc, resQ):
+  '''consumer process:
+       kind: 'oblig', 'random' or 'mpQ'
+       tProc: time spent per event (s) to emulate processing
+  '''
+  lat = []
+  n = 0
+  c0, t0 = cpuTime(), time.time()
+  while BM.ACTIVE.value:
+    if kind == 'mpQ':
+      try:
+        e = Q.get(True, 0.1)
+      except Exception:
+        continue
+    else:
+      e = BM.getEvent(cid, mode=0 if kind == 'oblig' else 1)
+    if e is None: break
+    lat.append(time.time() - BM.BMT0.value - e[1])
+    n += 1
+    if tProc > 0.: time.sleep(tProc)
+  resQ.put((kind, n, lat, (cpuTime() - c0)/(time.time() - t0)))
+
+def runBench(par, tRun, tWarm):
+  '''run BufferMan with parameters par, return dictionary of results'''
+  dev = SynthDevice(par['NChannels'], par['NSamples'], par['rate'],
+                    par['NCaptures'])
+  BM = BMan.BufferMan({'NBuffers': par['NBuffers'], 'verbose': 0,
+                       'RawData': par['RawData'],
+                       'ZeroCopy': par['ZeroCopy'],
+                       'Timing': par['Timing']}, dev)
+  dev.setBufferManagerPointer(BM)
+  resQ = mp.Queue()
+  procs = []
+  for kind in ('oblig', 'random', 'mpQ'):
+    for i in range(par[kind]):
+      if kind == 'mpQ':
+        cid, Q = BM.BMregister_mpQ()
+      else:
+        cid, Q = BM.BMregister(), None
+      procs.append(mp.Process(name=kind, target=consumer,
+                              args=(BM, kind, cid, Q, par['tProc'], resQ)))
+  # as BM.start(), but without control window
+  BM.ACTIVE.value = True
+  BM.runStarted = False
+  BM.start_manageDataBuffer = True
+  thr = threading.Thread(target=BM.acquireData)
+  thr.daemon = True
+  thr.start()
+  for p in procs: p.start()
+  BM.run()
+  mgrPid = BM.procs[-1].pid
+
+  time.sleep(tWarm)
+  n0, tl0, t0 = BM.Ntrig.value, BM.Tlife.value, time.time()
+  c0, cm0 = cpuTime(), cpuTime(mgrPid)
+  time.sleep(tRun)
+  n1, tl1, t1 = BM.Ntrig.value, BM.Tlife.value, time.time()
+  c1, cm1 = cpuTime(), cpuTime(mgrPid)
+
+  BM.ACTIVE.value = False # ends producer, manager and consumers
+  BM.prodWakeup.notify()
+  for w in BM.clientWakeups: w.notify()
+  res = {'rate': (n1 - n0)/(t1 - t0),
+         'lifefrac': 100.*(tl1 - tl0)/(t1 - t0),
+         'cpu_producer': (c1 - c0)/(t1 - t0),
+         'cpu_manager': None if cm0 is None else (cm1 - cm0)/(t1 - t0),
+         'consumers': [] }
+  if par['Timing']: 
+    res['latency'] = BM.latency.summary()
+  for p in procs:
+    kind, n, lat, cpu = resQ.get()
+    lat = np.array(lat[len(lat)//10:]) * 1000. # skip warm-up, in ms
+    res['consumers'].append({'kind': kind, 'events': n,
+      'p50_ms': float(np.percentile(lat, 50)) if len(lat) else None,
+      'p99_ms': float(np.percentile(lat, 99)) if len(lat) else None,
+      'cpu': cpu })
+  for p in procs: p.join(1.)
+  for p in BM.procs: p.terminate()
+  return res
+
+if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
+
+  print('\n*==* script ' + sys.argv[0] + ' running \n')
+  confFile = 'benchBufMan.yaml'
+  if len(sys.argv) >= 2: confFile = sys.argv[1]
+  outFile = 'benchBufMan_' + time.strftime('%y%m%d-%H%M') + '.json'
+  if len(sys.argv) >= 3: outFile = sys.argv[2]
+
+  conf = {}
+  if os.path.exists(confFile):
+    print('    benchmark configuration from file ' + confFile)
+    with open(confFile) as f:
+      conf = yaml.safe_load(f)
+
+  # parameters to scan (lists) and defaults
+  scan = {'NBuffers': [16], 'NChannels': [2], 'NSamples': [200],
+          'NCaptures': [1], 'rate': [0.], 'RawData': [False],
+          'ZeroCopy': [False], 'Timing': [False], 'oblig': [1], 'random': [0], 'mpQ': [0],
+          'tProc': [0.]}
+  for k in scan:
+    if k in conf:
+      scan[k] = conf[k] if type(conf[k]) == type([]) else [conf[k]]
+  tRun = conf['tRun'] if 'tRun' in conf else 5.
+  tWarm = conf['tWarm'] if 'tWarm' in conf else 1.
+
+  results = {'version': picodaqa.__version__,
+             'python': platform.python_version(),
+             'numpy': np.__version__,
+             'host': platform.node(), 'ncpu': mp.cpu_count(),
+             'date': time.strftime('%y-%m-%d %H:%M'),
+             'tRun': tRun, 'runs': []}
+  keys = list(scan.keys())
+  for vals in itertools.product(*[scan[k] for k in keys]):
+    par = dict(zip(keys, vals))
+    res = runBench(par, tRun, tWarm)
+    results['runs'].append({'par': par, 'res': res})
+    print('  ' + ' '.join('%s=%s'%(k, v) for k, v in par.items()))
+    print('    rate %.4gHz  life %.1f%%  cpu: producer %.2f  manager %s'\
+      %(res['rate'], res['lifefrac'], res['cpu_producer'],
+        '%.2f'%res['cpu_manager'] if res['cpu_manager'] is not None else '-'))
+    for c in res['consumers']:
+      if c['p50_ms'] is None: 
+        print('    %-6s no events' %(c['kind']) )
+        continue
+      print('    %-6s %7i events  p50 %.3gms  p99 %.3gms  cpu %.2f'\
+        %(c['kind'], c['events'], c['p50_ms'], c['p99_ms'], c['cpu']) )
+
+  with open(outFile, 'w') as f:
+    json.dump(results, f, indent=1)
+  print('\n*==* results written to ' + outFile)
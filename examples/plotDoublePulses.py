@@ -14,6 +14,7 @@ import matplotlib.pyplot as plt, matplotlib.animation as anim
 
 # animated displays running as background processes/threads
 from picodaqa.Oscilloscope import *
+from picodaqa.BMrecorder import RunFileReader
 
 def yieldEvt():
   cnt = 0
@@ -34,20 +35,26 @@ if __name__ == "__main__": # -----------------------------
     fnam = 'rawDPtest.dat'
   print('    input from file ' + fnam)
   try:
-    with open(fnam) as f:
-      print("*= loading data")
-      obj = yaml.load(f, Loader=yaml.Loader)
+    if fnam.endswith('.pdaq'): # binary run file, events read on demand
+      rf = RunFileReader(fnam)
+      conf = rf.conf['OscConfDict']
+      data = (rf.toVolts(rf.event(i)[1]) for i in range(rf.NEvents))
+      Ndat = rf.NEvents
+    else: # yaml file of older versions
+      with open(fnam) as f:
+        print("*= loading data")
+        obj = yaml.load(f, Loader=yaml.Loader)
+      conf = obj['OscConf']
+      data = obj['data']
+      Ndat = len(data)
   except:
     print('     failed to read input file ' + fnam)
     exit(1)
 
-  data = obj['data']
-  Ndat = len(data)
   print("*= %i data sets found"%(Ndat) )
   
   plt.ion()  
   print("*= start animation")
-  conf = obj['OscConf']
   Osci = Oscilloscope(conf, 'DoublePulse') 
   figOs = Osci.fig
   twait = 0.5  # time between figure updates in s
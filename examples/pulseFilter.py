@@ -1,12 +1,17 @@
 from __future__ import print_function,division,absolute_import,unicode_literals
 
-import sys, os, time, yaml, numpy as np
+import sys, os, time, heapq, numpy as np
 from scipy.signal import argrelmax
 from scipy.interpolate import interp1d
-from multiprocessing import Queue
+from multiprocessing import Queue, Process
+if sys.version_info[0] < 3:
+  from Queue import Empty
+else:
+  from queue import Empty
 
 # animated displays running as background processes/threads
 from picodaqa.Oscilloscope import *
+from picodaqa.BMrecorder import RunFileWriter, runFileConf
 
   # helper function to generate general unipolar or bipolar template
 def trapezoidPulse(t, tr, ton, tf, tf2=0, toff=0., tr2=0., mode=0):
@@ -32,12 +37,8 @@ def trapezoidPulse(t, tr, ton, tf, tf2=0, toff=0., tr2=0., mode=0):
   if mode: # for bipolar pulse
   # normalize neg. pulse to same integral as positive part
     voff = -(0.5*(tr+tf)+ton) / (0.5*(tf2+tr2)+toff) 
-    ti = ti.append(tr+ton+tf+tf2)
-    ri = ri.append(voff) 
-    ti = ti.append(tr+ton+tf+tf2+toff)
-    ri = ri.append(voff) 
-    ti = ti.append(tr+ton+tf+tf2+toff+tr2)
-    ri = ri.append(0.) 
+    ti += [tr+ton+tf+tf2, tr+ton+tf+tf2+toff, tr+ton+tf+tf2+toff+tr2]
+    ri += [voff, voff, 0.]
 
   fpulse = interp1d(ti, ri, kind='linear', copy=False, assume_sorted= True)
   return fpulse(t)
@@ -54,243 +55,147 @@ def setRefPulse(dT, taur=20E-9, tauon=12E-9, tauf=128E-9, mode=0,
       mode : 0 uni-polar  1 bi-polar
   '''
   tp = taur + tauon + tauf
+  if mode: tp += tauf2 + tauoff + taur2 # bi-polar pulse
   l = np.int32( tp/dT +0.5 ) + 1  
   ti = np.linspace(0, tp, l)    
-  rp = trapezoidPulse(ti, taur, tauon, tauf, mode) # uni-polar pulse
+  rp = trapezoidPulse(ti, taur, tauon, tauf, tauf2, tauoff, taur2, mode)
   rp = pheight * rp   # normalize to pulse height
 
   return rp
 
-def pulseFilter(BM, cId, confDict = None,
-                filtRateQ = None, histQ = None, VSigQ = None, 
-                fileout = None, verbose=1):
+class PulseSearch(object):
   '''
-    Find a pulse similar to a template pulse by cross-correlatation
+    pulse search in one event by correlation with reference pulses
 
-      - implemented as an obligatory consumer, i.e.  sees all data
-
-      - pulse detection via correlation with reference pulse;
-
-          - detected pulses are cleaned in a second step by subtracting 
-           the pulse mean (increased sensitivity to pulse shape)
+      - detected pulses are cleaned in a second step by subtracting
+        the pulse mean (increased sensitivity to pulse shape)
 
       - analyis proceeds in three steps:
 
           1. validation of pulse on trigger channel
           2. coincidences on other channels near validated trigger pulse
           3. seach for addtional pulses on any channel
-  '''
-
-# buffermanager must be active
-  if not BM.ACTIVE.value: 
-    if verbose: print("*==* pulseFilter: Buffer Manager not active, exiting")
-    sys.exit(1)
-
-# print information to log-window via BufferManager prlog
-  prlog = BM.prlog
-
-# set characteristics of reference pulse for convolution pulse search
-
-  if confDict == None:
-    confDict = {}
-#   set default unipolar pulse:
-    confDict['logFile'] = None
-    confDict['logFile2'] = 'dpFilt'
-    confDict['rawFile'] = None
-    confDict['pictFile'] = None
-
-    confDict['pulseShape'] = [ {
-       'taur'    : 20E-9,    # rise time in (s)
-       'tauon'   : 12E-9,    # hold time in (s)
-       'tauf'    : 128E-9,   # fall time in (s)
-       'mode'    : 0,        # uni-polar pulse
-       'pheight' : -0.035    # pulse height (V) 
-      } ]
-
-#   confDict[' analysisLevel'] = 2
-
-  try: 
-    refPulseDicts=confDict['pulseShape']    
-
-    if "logFile" in confDict:
-      logFile = confDict['logFile']
-      if logFile == None: logFile = None
-    else:
-      logFile = 'pFilt'
-
-    if "logFile2" in confDict:
-      logFile2 = confDict['logFile2']
-      if logFile2 == None: logFile2 = None
-    else:
-      logFile2 = 'dpFilt'
-
-    if "rawFile" in confDict:
-      rawFile = confDict['rawFile']
-      if rawFile == None: rawFile = None
-    else:
-      rawFile = None
 
-    if "pictFile" in confDict:
-      pictDir = confDict['pictFile']
-    else:
-      pictDir = None
-        
-    if "modules" in confDict:
-      modules = confDict['modules']
-    else:
-      modules = ['RMeter','Hists']
-
-#    if "analysisLevel" in confDict:
-#      analysisLevel = confDict['analysisLevel']
-#    else:
-#      analysisLevel = 2
-
-  except:
-    print('     failed to read pulseFilter configuration ')
-    exit(1)
+      - with several reference pulses (template bank), all templates
+        are correlated in one pass; at each step, the valid pulse with
+        the largest correlation relative to the threshold of its
+        template is taken, and the number of this template is reported
 
+      - correlations over long traces are computed blockwise by FFT
+        (overlap-save), if estimated to be faster than direct
+        correlation (see correlate)
 
-# open and initialize files
-  datetime=time.strftime('%y%m%d-%H%M', time.localtime())
-  if logFile is not None:
-#    logf=None
-    logf = open(logFile + '_' + datetime+'.dat', 'w')
-    print("# EvNr, EvT, Vs ...., Ts ...T", 
-      file=logf) # header line
-  else:
-    logf = None
-
-  if logFile2 is not None:
-    logf2 = open(logFile2 + '_' + datetime+'.dat', 'w', 1)
-    print("# Nacc, Ndble, Tau, delT(iChan), ... V(iChan)", 
-      file=logf2) # header line 
-  else:
-    logf2 = None
-
-  if rawFile is not None:
-    rawf = open(rawFile + '_' + datetime+'.dat', 'w', 1)
-    print("--- #raw waveforms",
-      file=rawf) # header line     
-    yaml.dump( {'OscConf': BM.DevConf.OscConfDict}, rawf )
-    yaml.dump( {'pFConf' : confDict}, rawf )
-    print('data: ',  file=rawf) # data tag    
-  else:
-    rawf = None  
-
-  if pictDir is not None: # create a directory to store pictures
-    pDir = (pictDir + '_' + datetime)
-    if not os.path.exists(pDir): os.makedirs(pDir)
-  # initialize oscolloscpe class used for plotting
-    Osci = Oscilloscope(BM.DevConf.OscConfDict, 'DoublePulse') 
-    figOs = Osci.fig
-    Osci.init()
-  else:
-    pDir = None  
+    Args:
+      BM: Buffer Manager instance
+      refPulseDicts: list of pulse shape parameters (see setRefPulse)
+      corrMethod: 'auto', 'direct' or 'fft'
+  '''
 
+  def __init__(self, BM, refPulseDicts, verbose=1, corrMethod='auto'):
 # retrieve relevant configuration parameters (from BufferManager)
-  dT = BM.TSampling # get sampling interval
-  idTprec = 2 # precision on time resolution of pulse search 
-  dTprec = idTprec * dT  # precision on time resolution (in units of dT)
-  NChan = BM.NChannels
-  NSamples = BM.NSamples
-  trgChan = BM.DevConf.trgChan     # trigger Channel
-  idT0 = int(BM.DevConf.NSamples * BM.DevConf.pretrig) # index of trigger T0
-  iCtrg = -1
-  for i, C in enumerate(BM.DevConf.picoChannels):   
-    if C == trgChan: 
-      iCtrg = i       # number of trigger Channel
-      break
-
-# generate reference pulse 
-#  refp = setRefPulse(dT, taur, tauon, tauf, pheight)
-  refp = setRefPulse(dT, **refPulseDicts[0])
-  print('pF: pulse parameters set')
-  taur = refPulseDicts[0]['taur'] 
-  tauon = refPulseDicts[0]['tauon'] 
-  tauf =  refPulseDicts[0]['tauf']
-  pheight = refPulseDicts[0]['pheight'] 
-
-  print('  taur: %.3g, tauon: %.3g, tauf: %.3g, height: %.3g'\
-        %(taur, tauon, tauf, pheight) )
-  refpm = refp - refp.mean()            # mean subtracted
-  lref = len(refp)
-
-# calculate thresholds for correlation analysis
-  pthr = np.sum(refp * refp) # norm of reference pulse
-  pthrm = np.sum(refpm * refpm) # norm of mean-subtracted reference pulse
-  if verbose > 1:
-    prlog('*==* pulse Filter: reference pulse')
-    prlog(np.array_str(refp) )
-    prlog('  thresholds: %.2g, %2g ' %(pthr, pthrm))
-
-# set mode for Buffer Manager
-  mode = 0    # obligatory consumer, get all events
-
-# --- end set-up 
-
-# initialise event loop
-  evcnt=0  # events seen
-  Nval=0  # events with valid pulse shape on trigger channel
-  Nacc=0
-  Nacc2=0  # dual coincidences
-  Nacc3=0     # triple coincidences
-  Ndble=0  # double pulses
-  T0 = time.time()
-
-# arrays for quantities to be histogrammed
-  hnTrSigs = [] #  pulse height of noise signals
-  hvTrSigs = [] #  pulse height of valid triggers
-  hVSigs = [] # pulse heights non-triggering channels
-  hTaus = []  # deltaT of double pulses
-#
-
-# event loop
-  while BM.ACTIVE.value:
-    validated = False
-    accepted = False
-    doublePulse = False
-    e = BM.getEvent(cId, mode=mode)
-    if e == None:
-      break             # end if empty event or BM no longer active
-
-    evNr, evTime, evData = e
-    evcnt+=1
+    self.dT = BM.TSampling # get sampling interval
+    self.idTprec = 2 # precision on time resolution of pulse search
+    self.NChan = BM.NChannels
+    self.NSamples = BM.NSamples
+    trgChan = BM.DevConf.trgChan     # trigger Channel
+    self.idT0 = int(BM.DevConf.NSamples * BM.DevConf.pretrig) # index of T0
+    self.iCtrg = -1
+    for i, C in enumerate(BM.DevConf.picoChannels):
+      if C == trgChan:
+        self.iCtrg = i       # number of trigger Channel
+        break
+
+# generate reference pulses
+    self.refps = [setRefPulse(self.dT, **d) for d in refPulseDicts]
+    self.NTempl = len(self.refps)
+    print('pF: pulse parameters set')
+    for d in refPulseDicts:
+      print('  taur: %.3g, tauon: %.3g, tauf: %.3g, height: %.3g'\
+            %(d['taur'], d['tauon'], d['tauf'], d['pheight']) )
+    # search window near trigger from earliest and latest pulse
+    self.taur = max(d['taur'] for d in refPulseDicts)
+    self.idmax = self.idT0 \
+      + max(d['taur'] + d['tauon'] for d in refPulseDicts)/self.dT \
+      + self.idTprec
+    self.refp = self.refps[0]
+    # mean subtracted
+    self.refpms = [refp - refp.mean() for refp in self.refps]
+    self.lrefs = np.array([len(refp) for refp in self.refps])
+    # template bank, padded with zeros to common length
+    self.lmax = self.lrefs.max()
+    self.bank = np.zeros( (self.NTempl, self.lmax) )
+    for k, refp in enumerate(self.refps):
+      self.bank[k, :len(refp)] = refp
+
+# calculate thresholds for correlation analysis, per template
+    # norm of reference pulse
+    self.pthrs = np.array([np.sum(refp * refp) for refp in self.refps])
+    # norm of mean-subtracted reference pulse
+    self.pthrms = np.array([np.sum(refpm * refpm) for refpm in self.refpms])
+    self.pthrc = self.pthrs[:, None]
     if verbose > 1:
-      prlog('*==* pulseFilter: event Nr %i, %i events seen'%(evNr,evcnt))
+      BM.prlog('*==* pulse Filter: reference pulse')
+      for k in range(self.NTempl):
+        BM.prlog(np.array_str(self.refps[k]) )
+        BM.prlog('  thresholds: %.2g, %2g '%(self.pthrs[k], self.pthrms[k]))
+
+# FFT correlation: block length and spectra of reversed reference pulses,
+#   computed once per run
+    self.corrMethod = corrMethod
+    self.nfft = max(256, 1 << int(np.ceil(np.log2(4 * self.lmax))))
+    self.Href = np.fft.rfft(self.bank[:, ::-1], self.nfft)
+    # cost per block, one forward and one inverse transform per template
+    self.cBlock = self.nfft * 0.75 * np.log2(self.nfft) * (1 + self.NTempl)
+
+  def __call__(self, evData):
+    '''
+    analyse one event
+
+      Args:
+        evData: event data in Volts, shape (NChannels, NSamples)
+
+      Returns: dictionary with results
+
+        validated: valid pulse on trigger channel
+        accepted: valid trigger pulse with coincidence(s)
+        doublePulse: further pulse(s) found in accepted event
+        VSig, TSig: lists per channel of pulse heights (V) and times (µs)
+        KSig: lists per channel of matching templates (-1: no pulse)
+        NSig: number of pulses per channel
+        Ncoinc: number of coincident pulses
+        tevt: event time (µs)
+        delT2s, sig2s: time difference and height of second pulses
+        tau: mean time difference of second pulses
+        hnTrSig: height of non-valid pulse on trigger channel, or None
+        hvTrSig: height of valid pulse on trigger channel, or None
+        hVSigs: heights of coincident pulses
+    '''
+    dT, idTprec, idT0 = self.dT, self.idTprec, self.idT0
+    lrefs, lmax = self.lrefs, self.lmax
+    NChan, iCtrg = self.NChan, self.iCtrg
 
-# find signal candidates by convoluting signal with reference pulse
 #   data structure to collect properties of selected pulses:
-    idSig = [ [0, 0] for i in range(NChan)] # time slice of valid pulse
-    VSig = [ [0., 0.] for i in range(NChan)]  # signal height in Volts
-    TSig = [ [0., 0.] for i in range(NChan)]  # time of valid pulse
-    NSig = [0 for i in range(NChan)]
+    r = self._result()
+    VSig, TSig, KSig, NSig = r['VSig'], r['TSig'], r['KSig'], r['NSig']
 
 # 1. validate trigger pulse
-    if iCtrg >= 0:  
-      offset = max(0, idT0 - int(taur/dT) - idTprec)
-      cort = np.correlate(evData[iCtrg, offset:idT0+idTprec+lref], 
-             refp, mode='valid')
-      cort[cort<pthr] = pthr # set all values below threshold to threshold
-      idtr = np.argmax(cort) + offset # index of 1st maximum 
-      if idtr > idT0 + (taur + tauon)/dT + idTprec:
-        if histQ: hnTrSigs.append(0.)
-        continue #- while # no pulse near trigger, skip rest of event analysis
-    # check pulse shape by requesting match with time-averaged pulse
-      evdt = evData[iCtrg, idtr:idtr+lref]
-      evdtm = evdt - evdt.mean()  # center signal candidate around zero
-      cc = np.sum(evdtm * refpm) # convolution with mean-corrected reference
-      if cc > pthrm:
-        validated = True # valid trigger pulse found, store
-        Nval +=1
-        V = max(abs(evdt)) # signal Voltage  
-        VSig[iCtrg][0] = V 
-        if histQ: hvTrSigs.append(V)
-        T = idtr*dT*1E6      # signal time in musec
-        TSig[iCtrg][0] = T 
-        tevt = T  # time of event
-      else:   # no valid trigger
-        hnTrSigs.append( max(abs(evdt)) )
-        continue #- while # skip rest of event analysis
+    if iCtrg >= 0:
+      offset = max(0, idT0 - int(self.taur/dT) - idTprec)
+      cort = self.correlate(evData[iCtrg, offset:idT0+idTprec+lmax])
+      idtr, ktr, V = self._best(evData[iCtrg], self._clip(cort), offset)
+      if idtr is None:
+        r['hnTrSig'] = 0.
+        return r # no pulse near trigger, skip rest of event analysis
+      if ktr < 0:   # no valid trigger
+        r['hnTrSig'] = V
+        return r # skip rest of event analysis
+      r['validated'] = True # valid trigger pulse found, store
+      VSig[iCtrg][0] = V
+      KSig[iCtrg][0] = ktr
+      r['hvTrSig'] = V
+      T = idtr*dT*1E6      # signal time in musec
+      TSig[iCtrg][0] = T
+      tevt = T  # time of event
     NSig[iCtrg] +=1
 
 # 2. find coincidences
@@ -299,83 +204,443 @@ def pulseFilter(BM, cId, confDict = None,
       if iC != iCtrg:
         offset = max(0, idtr - idTprec)  # search around trigger pulse
     #  analyse channel to find pulse near trigger
-        cor = np.correlate(evData[iC, offset:idT0+idTprec+lref], 
-              refp, mode='valid')
-        cor[cor<pthr] = pthr # set all values below threshold to threshold
-        id = np.argmax(cor)+offset # find index of (1st) maximum 
-        if id > idT0 + (taur + tauon)/dT + idTprec:
-          continue # no pulse near trigger, skip
-        evd = evData[iC, id:id+lref]
-        evdm = evd - evd.mean()  # center signal candidate around zero
-        cc = np.sum(evdm * refpm) # convolution with mean-corrected reference
-        if cc > pthrm:
-          NSig[iC] +=1
-          Ncoinc += 1 # valid, coincident pulse
-          V = max(abs(evd))
-          VSig[iC][0] = V         # signal voltage  
-          hVSigs.append(V)         
-          T = id*dT*1E6 # signal time in musec
-          TSig[iC][0] = T 
-          tevt += T
-
-# check wether event should be accepted 
-    if (NChan == 1 and validated) or (NChan > 1 and Ncoinc >=2):
-      accepted = True
-      Nacc += 1
+        cor = self.correlate(evData[iC, offset:idT0+idTprec+lmax])
+        id, k, V = self._best(evData[iC], self._clip(cor), offset)
+        if id is None or k < 0:
+          continue # no valid pulse near trigger, skip
+        NSig[iC] +=1
+        Ncoinc += 1 # valid, coincident pulse
+        VSig[iC][0] = V         # signal voltage
+        KSig[iC][0] = k
+        r['hVSigs'].append(V)
+        T = id*dT*1E6 # signal time in musec
+        TSig[iC][0] = T
+        tevt += T
+    r['Ncoinc'] = Ncoinc
+
+# check wether event should be accepted
+    if (NChan == 1 and r['validated']) or (NChan > 1 and Ncoinc >=2):
+      r['accepted'] = True
     else:
-      continue #- while 
+      return r
 
 # fix event time:
     tevt /= Ncoinc
-    if Ncoinc == 2:
-      Nacc2 += 1
-    elif Ncoinc == 3:
-      Nacc3 += 1
+    r['tevt'] = tevt
 
 # 3. find subsequent pulses in accepted events
-    offset = idtr + lref # search after trigger pulse
+    offset = idtr + lrefs[ktr] # search after trigger pulse
     for iC in range(NChan):
-      cor = np.correlate(evData[iC, offset:], refp, mode='valid')
-      cor[cor<pthr] = pthr # set all values below threshold to threshold
-      idmx, = argrelmax(cor)+offset # find index of maxima in evData array
+      cor = self._clip(self.correlate(evData[iC, offset:]))
+      ks, ids = argrelmax(cor, axis=1) # maxima for each template
 # clean-up pulse candidates by requesting match with time-averaged pulse
-      iacc = 0
-      for id in idmx:
-        evd = evData[iC, id:id+lref]
-        evdm = evd - evd.mean()  # center signal candidate around zero
-        cc = np.sum(evdm * refpm) # convolution with mean-corrected reference
-        if cc > pthrm: # valid pulse 
-          iacc+=1
-          NSig[iC] += 1
-          V = max(abs(evd)) # signal Voltage 
-          if iacc == 1:
-            VSig[iC][1] = V 
-            TSig[iC][1] = id*dT*1E6   # signal time in musec
-          else: 
-            VSig[iC].append(V) # extend arrays if more than 1 extra pulse
-            TSig[iC].append(id*dT*1E6)   
-#     -- end loop over pulse candidates
+      ok = np.zeros(len(ids), bool)
+      Vs = np.zeros(len(ids))
+      for i in range(len(ids)):
+        k, id = ks[i], ids[i] + offset
+        evd = evData[iC, id:id+lrefs[k]]
+        if self._match(evd, k) > self.pthrms[k]: # valid pulse
+          ok[i] = True
+          Vs[i] = max(abs(evd)) # signal Voltage
+      ks, ids, Vs = ks[ok], ids[ok], Vs[ok]
+      scores = cor[ks, ids] / self.pthrs[ks]
+      self._addPulses(r, iC, ids + offset, ks, scores, Vs)
 #   -- end for loop over channels
-     
+
+    return self._doublePulses(r)
+
+  def _result(self):
+    NChan = self.NChan
+    return {'validated': False, 'accepted': False, 'doublePulse': False,
+            'VSig': [ [0., 0.] for i in range(NChan)], # height in Volts
+            'TSig': [ [0., 0.] for i in range(NChan)], # time of pulse
+            'KSig': [ [-1, -1] for i in range(NChan)], # template
+            'NSig': [0 for i in range(NChan)],
+            'Ncoinc': 0, 'tevt': 0.,
+            'hnTrSig': None, 'hvTrSig': None, 'hVSigs': []}
+
+  def _clip(self, C):
+    # set all values below threshold of template to threshold
+    return np.maximum(C, self.pthrc)
+
+  def _match(self, evd, k):
+    evdm = evd - evd.mean()  # center signal candidate around zero
+    return np.sum(evdm * self.refpms[k]) # convolution with mean-corrected reference
+
+  def _best(self, x, C, offset):
+    '''
+    best matching template at the maxima of correlation C,
+    shape (NTemplates, L), of trace x starting at index offset
+
+      Returns: index of pulse, template, pulse height
+        template -1: no valid pulse, height of best candidate
+        index None: no pulse in time window near trigger
+    '''
+    ids = np.argmax(C, axis=1) # index of (1st) maximum per template
+    if self.NTempl == 1:
+      order = (0,)
+    else: # by decreasing correlation relative to threshold
+      order = np.argsort(-C[np.arange(len(ids)), ids] / self.pthrs, 
+                         kind='stable')
+    ids = ids + offset
+    idc, Vc = None, 0.
+    for k in order:
+      if ids[k] > self.idmax: continue # no pulse near trigger
+      evd = x[ids[k]:ids[k]+self.lrefs[k]]
+      if self._match(evd, k) > self.pthrms[k]:
+        return ids[k], k, max(abs(evd))
+      if idc is None: idc, Vc = ids[k], max(abs(evd))
+    return idc, -1, Vc
+
+  def _addPulses(self, r, iC, ids, ks, scores, Vs):
+    '''
+    store additional pulses on channel iC; of overlapping pulses found
+    with different templates, the one with the largest score is kept
+    '''
+    dT, lrefs = self.dT, self.lrefs
+    VSig, TSig, KSig, NSig = r['VSig'], r['TSig'], r['KSig'], r['NSig']
+    order = np.lexsort( (ks, ids) )
+    if self.NTempl > 1:
+      keep = []
+      for i in sorted(order, key=lambda i: -scores[i]):
+        if all(ks[j] == ks[i] or abs(ids[j] - ids[i]) >=
+                 min(lrefs[ks[i]], lrefs[ks[j]]) for j in keep):
+          keep.append(i)
+      order = [i for i in order if i in keep]
+    for iacc, i in enumerate(order):
+      NSig[iC] += 1
+      if iacc == 0:
+        VSig[iC][1] = Vs[i]
+        TSig[iC][1] = ids[i]*dT*1E6   # signal time in musec
+        KSig[iC][1] = ks[i]
+      else:
+        VSig[iC].append(Vs[i]) # extend arrays if more than 1 extra pulse
+        TSig[iC].append(ids[i]*dT*1E6)
+        KSig[iC].append(ks[i])
+
+  def _doublePulses(self, r):
 #  statistics on double pulses on either channel
+    NChan = self.NChan
+    VSig, TSig, tevt = r['VSig'], r['TSig'], r['tevt']
     delT2s=np.zeros(NChan)
     sig2s=np.zeros(NChan)
     sumdT2 = 0.
     N2nd = 0.
     for iC in range(NChan):
       if VSig[iC][1] > 0.:
-        doublePulse = True
+        r['doublePulse'] = True
         N2nd += 1
-        delT2s[iC] = TSig[iC][-1] - tevt  # take last pulse found 
+        delT2s[iC] = TSig[iC][-1] - tevt  # take last pulse found
         sig2s[iC] = VSig[iC][-1]
         sumdT2 += delT2s[iC]
+    r['delT2s'] = delT2s
+    r['sig2s'] = sig2s
+    if r['doublePulse']:
+      r['tau'] = sumdT2 / N2nd
+    return r
+
+  def correlate(self, X):
+    '''correlation with all reference pulses along last axis of X
+       (as np.correlate, mode 'valid'), for all events and channels;
+       direct or by FFT, whichever is estimated to be faster
+
+       Returns: array of shape X.shape[:-1] + (NTemplates, L)
+    '''
+    lmax = self.lmax
+    L = X.shape[-1] - lmax + 1
+    if L < 1: # shorter than reference pulse
+      return np.zeros(X.shape[:-1] + (self.NTempl, 0))
+    if self._useFFT(X):
+      return self._fftCorrelate(X)
+    if X.ndim == 1 and self.NTempl == 1:
+      return np.correlate(X, self.refp, mode='valid')[None]
+    R = self.bank
+    X = X[..., None, :] # broadcast over templates
+    C = R[:, 0, None] * X[..., 0:L]
+    for j in range(1, lmax):
+      C += R[:, j, None] * X[..., j:j+L]
+    return C
+
+  def _useFFT(self, X):
+    if self.corrMethod != 'auto':
+      return self.corrMethod == 'fft'
+    lmax = self.lmax
+    L = X.shape[-1] - lmax + 1
+    Nrows = X.size // X.shape[-1]
+    # estimated cost in units of multiply-adds of direct correlation,
+    #   from timing measurements; FFT has a fixed overhead per call
+    cdirect = Nrows * self.NTempl * L * lmax
+    if cdirect < 5E4: 
+      return False
+    nBlocks = -(-L // (self.nfft - lmax + 1))
+    return Nrows * nBlocks * self.cBlock + 5E4 < cdirect
+
+  def _fftCorrelate(self, X):
+    '''correlation by FFT, overlap-save with cached spectra of
+       reference pulses; cost grows linearly with length of X'''
+    lmax, nfft = self.lmax, self.nfft
+    NS = X.shape[-1]
+    L = NS - lmax + 1
+    B = nfft - lmax + 1 # valid samples per block
+    nBlocks = -(-L // B)
+    shape = X.shape[:-1] + (self.NTempl, L)
+    X = X.reshape(-1, NS)
+    # zero-padded copy, blocks of length nfft overlap by lmax-1 samples
+    Xp = np.zeros( (len(X), nBlocks*B + lmax - 1) )
+    Xp[:, :NS] = X
+    s0, s1 = Xp.strides
+    blocks = np.lib.stride_tricks.as_strided(Xp,
+               shape=(len(X), 1, nBlocks, nfft), strides=(s0, 0, B*s1, s1))
+    C = np.fft.irfft(np.fft.rfft(blocks) * self.Href[:, None, :],
+                     nfft)[..., lmax-1:]
+    return C.reshape(len(X), self.NTempl, nBlocks*B)[..., :L].reshape(shape)
+
+  def batch(self, evData):
+    '''
+    analyse a block of events, vectorized over events and channels;
+    same results as calling the instance for each event
+
+      Args:
+        evData: event data in Volts, shape (n, NChannels, NSamples)
+
+      Returns: list of dictionaries with results, see __call__()
+    '''
+    dT, idTprec, idT0 = self.dT, self.idTprec, self.idT0
+    lrefs, lmax = self.lrefs, self.lmax
+    pthrs, pthrms = self.pthrs, self.pthrms
+    NChan, iCtrg, NTempl = self.NChan, self.iCtrg, self.NTempl
+    n, NS = len(evData), evData.shape[-1]
+    # search windows near trigger: positions p0 ... p1-1
+    p0 = max(0, idT0 - int(self.taur/dT) - idTprec)
+    p1 = min(idT0 + idTprec + lmax, NS) - lmax + 1
+    if iCtrg < 0 or p1 <= p0:
+      return [self(d) for d in evData]
+
+    # correlation of all events and channels with reference pulses
+    #   near trigger, values below threshold set to threshold
+    C = self._clip(self.correlate(
+          evData[:, :, :p1+lmax-1].astype(np.float64)))
+    def window(iC, evs, ids, k): # candidate pulses, shape (len(evs), lref)
+      return evData[evs[:, None], iC, ids[:, None] + np.arange(lrefs[k])]
+    def match(evd, k): # convolution with mean-corrected reference
+      evdm = evd - evd.mean(axis=1, keepdims=True) # center around zero
+      return np.sum(evdm * self.refpms[k], axis=1)
+    ev = np.arange(n)
+    def best(iC, Cw):
+      # best template at maxima of Cw, shape (n, NTemplates, p1),
+      #   see _best; Returns: index, template, height, any in window
+      ids = np.argmax(Cw, axis=2)
+      scores = np.take_along_axis(Cw, ids[:, :, None], 2)[:, :, 0] / pthrs
+      inwin = ids <= self.idmax
+      ok = np.zeros( (n, NTempl), bool)
+      V = np.zeros( (n, NTempl) )
+      for k in range(NTempl):
+        evd = window(iC, ev, ids[:, k], k)
+        ok[:, k] = inwin[:, k] & (match(evd, k) > pthrms[k])
+        V[:, k] = np.abs(evd).max(axis=1)
+      kb = np.argmax(np.where(ok, scores, -np.inf), axis=1)
+      kw = np.argmax(np.where(inwin, scores, -np.inf), axis=1)
+      valid = ok.any(axis=1)
+      k = np.where(valid, kb, kw)
+      return ids[ev, k], np.where(valid, k, -1), V[ev, k], inwin.any(axis=1)
+
+# 1. validate trigger pulse
+    ip = np.arange(p1)
+    Cw = C[:, iCtrg].copy()
+    Cw[:, :, ip < p0] = -np.inf
+    idtr, ktr, VTrg, trg = best(iCtrg, Cw)
+    valid = ktr >= 0
+
+# 2. find coincidences, search starts before trigger pulse
+    coinc, idc, kc, Vc = {}, {}, {}, {}
+    for iC in range(NChan):
+      if iC == iCtrg: continue
+      Cw = np.where(ip < np.maximum(0, idtr - idTprec)[:, None, None],
+                    -np.inf, C[:, iC])
+      idc[iC], kc[iC], Vc[iC], inw = best(iC, Cw)
+      coinc[iC] = valid & (kc[iC] >= 0)
+    Ncoinc = np.ones(n, dtype=int) # array also without other channels
+    Ncoinc += sum(coinc[iC].astype(int) for iC in coinc)
+    accepted = valid & (Ncoinc >= 2) if NChan > 1 else valid
+
+# 3. find subsequent pulses in accepted events: local maxima
+#    of correlation after trigger pulse, validated by shape
+    offset = idtr + lrefs[np.maximum(ktr, 0)]
+    iacc = np.nonzero(accepted)[0]
+    # correlation of whole trace, starting at earliest offset
+    o3 = offset[iacc].min() if len(iacc) else 0
+    C3 = self._clip(self.correlate(
+           evData[iacc, :, o3:].astype(np.float64)))
+    L = C3.shape[-1]
+    pulses = {}
+    for iC in range(NChan):
+      cands = []
+      for k in range(NTempl):
+        Cs = C3[:, iC, k]
+        M = np.zeros((len(iacc), L), bool)
+        M[:, 1:-1] = (Cs[:, 1:-1] > Cs[:, :-2]) & (Cs[:, 1:-1] > Cs[:, 2:])
+        M &= np.arange(o3, o3 + L) > offset[iacc, None]
+        ievs, ids = np.nonzero(M)
+        scores = Cs[ievs, ids] / pthrs[k]
+        evs, ids = iacc[ievs], ids + o3
+        evd = window(iC, evs, ids, k)
+        ok = match(evd, k) > pthrms[k]
+        cands.append( (evs[ok], ids[ok], np.full(ok.sum(), k), scores[ok],
+                       np.abs(evd[ok]).max(axis=1)) )
+      evs, ids, ks, scores, Vs = [np.concatenate(c) for c in zip(*cands)]
+      order = np.lexsort( (ks, ids, evs) )
+      evs, ids, ks, scores, Vs = \
+        evs[order], ids[order], ks[order], scores[order], Vs[order]
+      bounds = np.searchsorted(evs, np.arange(n+1))
+      pulses[iC] = (ids, ks, scores, Vs, bounds)
+
+    # results per event
+    results = []
+    for i in range(n):
+      r = self._result()
+      results.append(r)
+      VSig, TSig, KSig, NSig = r['VSig'], r['TSig'], r['KSig'], r['NSig']
+      if not trg[i]:
+        r['hnTrSig'] = 0.
+        continue
+      if not valid[i]:
+        r['hnTrSig'] = VTrg[i]
+        continue
+      r['validated'] = True
+      VSig[iCtrg][0] = VTrg[i]
+      KSig[iCtrg][0] = ktr[i]
+      r['hvTrSig'] = VTrg[i]
+      T = idtr[i]*dT*1E6
+      TSig[iCtrg][0] = T
+      tevt = T
+      NSig[iCtrg] += 1
+      for iC in coinc:
+        if coinc[iC][i]:
+          NSig[iC] += 1
+          VSig[iC][0] = Vc[iC][i]
+          KSig[iC][0] = kc[iC][i]
+          r['hVSigs'].append(Vc[iC][i])
+          T = idc[iC][i]*dT*1E6
+          TSig[iC][0] = T
+          tevt += T
+      r['Ncoinc'] = int(Ncoinc[i])
+      if not accepted[i]: continue
+      r['accepted'] = True
+      r['tevt'] = tevt / Ncoinc[i]
+      for iC in range(NChan):
+        ids, ks, scores, Vs, bounds = pulses[iC]
+        s = slice(bounds[i], bounds[i+1])
+        self._addPulses(r, iC, ids[s], ks[s], scores[s], Vs[s])
+      self._doublePulses(r)
+    return results
+# - end PulseSearch
+
+class pFoutput(object):
+  '''
+    book-keeping of pulseFilter results: counters, log files, 
+    raw waveforms, pictures and information for display processes 
+
+    results must be given in the order of events
+  '''
+
+  def __init__(self, BM, confDict, logFile, logFile2, rawFile, pictDir,
+               filtRateQ = None, hists = None, VSigQ = None, verbose=1):
+    self.BM = BM
+    self.prlog = BM.prlog
+    self.NChan = BM.NChannels
+    self.filtRateQ = filtRateQ
+    self.hists = hists # histograms in shared memory (sharedHists)
+    self.VSigQ = VSigQ
+    self.verbose = verbose
+    # with several templates, log number of matching template
+    self.NTempl = len(confDict['pulseShape']) \
+                    if 'pulseShape' in confDict else 1
+
+# open and initialize files
+    datetime=time.strftime('%y%m%d-%H%M', time.localtime())
+    if logFile is not None:
+      self.logf = open(logFile + '_' + datetime+'.dat', 'w')
+      if self.NTempl > 1:
+        print("# EvNr, EvT, Vs ...., Ts ...T, templates ...", 
+          file=self.logf) # header line
+      else:
+        print("# EvNr, EvT, Vs ...., Ts ...T", 
+          file=self.logf) # header line
+    else:
+      self.logf = None
+
+    if logFile2 is not None:
+      self.logf2 = open(logFile2 + '_' + datetime+'.dat', 'w', 1)
+      print("# Nacc, Ndble, Tau, delT(iChan), ... V(iChan)", 
+        file=self.logf2) # header line 
+    else:
+      self.logf2 = None
+
+    if rawFile is not None: # binary run file, see BMrecorder.py
+      self.rawf = RunFileWriter(rawFile + '_' + datetime+'.pdaq', 
+                     runFileConf(BM, pFConf=confDict), BM.header.dtype)
+    else:
+      self.rawf = None  
+
+    if pictDir is not None: # create a directory to store pictures
+      self.pDir = (pictDir + '_' + datetime)
+      if not os.path.exists(self.pDir): os.makedirs(self.pDir)
+    # initialize oscolloscpe class used for plotting
+      self.Osci = Oscilloscope(BM.DevConf.OscConfDict, 'DoublePulse') 
+      self.figOs = self.Osci.fig
+      self.Osci.init()
+    else:
+      self.pDir = None  
+
+# initialise counters
+    self.evcnt=0  # events seen
+    self.Nval=0  # events with valid pulse shape on trigger channel
+    self.Nacc=0
+    self.Nacc2=0  # dual coincidences
+    self.Nacc3=0     # triple coincidences
+    self.Ndble=0  # double pulses
+
+  def record(self, evNr, evTime, r, evRaw=None, header=None):
+    '''
+    Args:
+      evNr, evTime: event number and time
+      r: results of PulseSearch
+      evRaw: event data as in buffer, needed for double pulses only
+      header: event header (as returned by BM.getHeaders), same 
+    '''
+    NChan = self.NChan
+    prlog = self.prlog
+    verbose = self.verbose
+    hists = self.hists
+    logf, logf2 = self.logf, self.logf2
+    self.evcnt+=1
+    if verbose > 1:
+      prlog('*==* pulseFilter: event Nr %i, %i events seen'\
+            %(evNr, self.evcnt))
+# fill histograms: noise and valid trigger pulse heights, 
+#   pulse heights in non-triggering channels, deltaT of double pulses
+    if hists is not None:
+      if r['hnTrSig'] is not None: hists.fill(0, r['hnTrSig'])
+      if r['hvTrSig'] is not None: hists.fill(1, r['hvTrSig'])
+      if len(r['hVSigs']): hists.fill(2, r['hVSigs'])
+    if r['validated']: self.Nval += 1
+    if not r['accepted']: return
+    self.Nacc += 1
+    Ncoinc = r['Ncoinc']
+    if Ncoinc == 2:
+      self.Nacc2 += 1
+    elif Ncoinc == 3:
+      self.Nacc3 += 1
+    VSig, TSig, KSig, tevt = r['VSig'], r['TSig'], r['KSig'], r['tevt']
+    doublePulse = r['doublePulse']
     if doublePulse:
-      Ndble += 1
-      if histQ: hTaus.append( sumdT2 / N2nd )
+      self.Ndble += 1
+      if hists is not None: hists.fill(3, r['tau'])
+    Nacc, Ndble = self.Nacc, self.Ndble
     
 # eventually store results in file(s)
 # 1. all accepted events
-    if logf is not None and accepted:
+    if logf is not None:
       print('%i, %.2f'%(evNr, evTime), end='', file=logf)
       for ic in range(NChan):
         v = VSig[ic][0]
@@ -392,101 +657,297 @@ def pulseFilter(BM, cId, confDict = None,
           if len(VSig[ic]) > 2:
             print(', %i, %.3f, %.3f'%(ic, VSig[ic][2],TSig[ic][2] ),
                   end='', file=logf)
+      if self.NTempl > 1: # templates of pulses
+        for ic in range(NChan):
+          print(', %i'%(KSig[ic][0]), end='', file=logf)
+        if doublePulse:
+          for ic in range(NChan):
+            print(', %i'%(KSig[ic][1]), end='', file=logf)
       print('', file=logf)
 
 # 2. double pulses
     if logf2 is not None and doublePulse:
+      delT2s, sig2s = r['delT2s'], r['sig2s']
       if NChan==1:
         print('%i, %i, %.4g,   %.4g, %.3g'\
-              %(Nacc, Ndble, hTaus[-1], delT2s[0], sig2s[0]),
+              %(Nacc, Ndble, r['tau'], delT2s[0], sig2s[0]),
               file=logf2)
       elif NChan==2:
         print('%i, %i, %.4g,   %.4g, %.4g,   %.3g, %.3g'\
-              %(Nacc, Ndble, hTaus[-1], 
+              %(Nacc, Ndble, r['tau'], 
                 delT2s[0], delT2s[1], sig2s[0], sig2s[1]),
                 file=logf2)
       elif NChan==3:
         print('%i, %i, %.4g,   %.4g, %.4g, %.4g,   %.3g, %.3g, %.3g'\
-              %(Nacc, Ndble, hTaus[-1], 
+              %(Nacc, Ndble, r['tau'], 
                 delT2s[0], delT2s[1], delT2s[2], 
                 sig2s[0], sig2s[1], sig2s[2]),
                 file=logf2)
 
-    if rawf is not None and doublePulse: # write raw waveforms
-      print( ' - ' + yaml.dump(np.around(evData, 5).tolist(),  
-                       default_flow_style=True ), 
-             file=rawf) 
+    if self.rawf is not None and doublePulse: # write raw waveforms
+      self.rawf.write(header.copy(), np.array(evRaw, ndmin=3))
 
-    if pDir is not None and doublePulse:
-      evt = Osci( (3, Ndble, evTime, evData) ) # update figure ...
-         #  use cnt=3 each time to avoid rate statistics 
-      figOs.savefig(pDir+'/DPfig%03i'%(Ndble)+'.png') # ... and save to .png
+    if self.pDir is not None and doublePulse:
+      evt = self.Osci( (3, Ndble, evTime, self.BM.toVolts(evRaw)) ) 
+         #  update figure, use cnt=3 each time to avoid rate statistics 
+      self.figOs.savefig(self.pDir+'/DPfig%03i'%(Ndble)+'.png') # save
 
 # print to screen 
-    if accepted and verbose > 1:
+    if verbose > 1:
       if NChan ==1:
-        prlog ('*==* pF: %i, %i, %.2f, %.3g, %.3g'\
-              %(evcnt, Nacc, tevt, VSig[0][0]) )
+        prlog ('*==* pF: %i, %i, %.2f, %.3g'\
+              %(self.evcnt, Nacc, tevt, VSig[0][0]) )
       elif NChan ==2:
-        prlog ('*==* pF: %i, %i, i%, %.3g, %.3g, %.3g'\
-               %(evcnt, Nval, Nacc, tevt, VSig[0][0], VSig[1][0]) )
+        prlog ('*==* pF: %i, %i, %i, %.3g, %.3g, %.3g'\
+               %(self.evcnt, self.Nval, Nacc, tevt, VSig[0][0], VSig[1][0]) )
       elif NChan ==3:
         prlog ('*==* pF: %i, %i, %i, %i, %i, %.3g'\
-              %(evcnt, Nval, Nacc, Nacc2, Nacc3, tevt) )
+              %(self.evcnt, self.Nval, Nacc, self.Nacc2, self.Nacc3, tevt) )
 
-    if(verbose and evcnt%1000==0):
+    if(verbose and self.evcnt%1000==0):
         prlog("*==* pF: evt %i, Nval, Nacc, Nacc2, Nacc3: %i, %i, %i, %i"\
-              %(evcnt, Nval, Nacc, Nacc2, Nacc3))
+              %(self.evcnt, self.Nval, Nacc, self.Nacc2, self.Nacc3))
 
     if verbose and doublePulse:
         s = '%i, %i, %.4g'\
-                 %(Nacc, Ndble, hTaus[-1])
+                 %(Nacc, Ndble, r['tau'])
         prlog('*==* double pulse: Nacc, Ndble, dT ' + s)
 
 # provide information for background display processes
 # -- RateMeter
-    if filtRateQ is not None and filtRateQ.empty(): 
-      filtRateQ.put( (Nacc, evTime) ) 
-
-# -- histograms
-    if len(hvTrSigs) and histQ is not None and histQ.empty(): 
-      histQ.put( [hnTrSigs, hvTrSigs, hVSigs, hTaus] )
-      hnTrSigs = []
-      hvTrSigs = []
-      hVSigs = []
-      hTaus = []
+    if self.filtRateQ is not None and self.filtRateQ.empty(): 
+      self.filtRateQ.put( (Nacc, evTime) ) 
 
 # -- Signal Display
-    if VSigQ is not None and VSigQ.empty(): 
+    if self.VSigQ is not None and self.VSigQ.empty(): 
       peaks = [VSig[iC][0] for iC in range(NChan) ]
-      VSigQ.put( peaks ) 
+      self.VSigQ.put( peaks ) 
+
+  def close(self):
+    '''add summary information to log-files'''
+    tag = "# pulseFilter Summary: " 
+    s = "last evNR %i, Nval, Nacc, Nacc2, Nacc3: %i, %i, %i, %i"\
+        %(self.evcnt, self.Nval, self.Nacc, self.Nacc2, self.Nacc3)
+    if self.logf is not None:
+      print(tag + s, file=self.logf )
+      self.logf.close()
+
+    if self.logf2 is not None: 
+      print(tag + s, file=self.logf2 )
+      print("#                       %i double pulses"%(self.Ndble), 
+          file=self.logf2 )
+      self.logf2.close()
+
+    if self.rawf is not None: 
+      self.rawf.close()
+# - end pFoutput
+
+def pFworker(BM, cId, k, NWorkers, NBatch, search, resQ):
+  '''
+    worker process of parallel pulseFilter
 
-# end BM.ACTIVE or break e == None  
+      reads blocks of events directly from the buffer (as obligatory
+      consumer) and analyses events with evNr % NWorkers == k, 
+      NBatch events at a time; results are sent to resQ together 
+      with the last event number seen, so that they can be merged 
+      in the order of events
+  '''
+  while BM.ACTIVE.value:
+    e = BM.getEvents(cId, NWorkers * NBatch)
+    if e is None: break
+    evNrs, evTimes, evData = e
+    own = [j for j in range(len(evNrs)) if evNrs[j] % NWorkers == k]
+    if NBatch > 1:
+      rs = search.batch(BM.toVolts(evData[own]))
+    else:
+      rs = [search(BM.toVolts(evData[j])) for j in own]
+    res = []
+    for j, r in zip(own, rs):
+      evRaw, header = None, None
+      if r['doublePulse']: # copy, buffer slot is released
+        evRaw = np.array(evData[j])
+        header = BM.getHeaders(cId)[j:j+1].copy()
+      res.append( (int(evNrs[j]), float(evTimes[j]), r, evRaw, header) )
+    resQ.put( (k, int(evNrs[-1]), res) )
+  resQ.put( (k, None, []) ) # end marker
+  BM.BMunregister(cId)
+
+def pulseFilter(BM, cId, confDict = None,
+                filtRateQ = None, hists = None, VSigQ = None, 
+                fileout = None, verbose=1):
+  '''
+    Find a pulse similar to a template pulse by cross-correlatation
+
+      - implemented as an obligatory consumer, i.e.  sees all data
+
+      - pulse detection via correlation with reference pulse,
+        see class PulseSearch
+
+      - with NBatch > 1 in confDict, blocks of NBatch events are
+        analysed at once (see PulseSearch.batch)
+
+      - with NWorkers > 1 in confDict, events are analysed by 
+        NWorkers processes reading directly from the buffer; results
+        are merged in the order of events
+  '''
+
+# buffermanager must be active
+  if not BM.ACTIVE.value: 
+    if verbose: print("*==* pulseFilter: Buffer Manager not active, exiting")
+    sys.exit(1)
+
+# print information to log-window via BufferManager prlog
+  prlog = BM.prlog
+
+# set characteristics of reference pulse for convolution pulse search
+
+  if confDict == None:
+    confDict = {}
+#   set default unipolar pulse:
+    confDict['logFile'] = None
+    confDict['logFile2'] = 'dpFilt'
+    confDict['rawFile'] = None
+    confDict['pictFile'] = None
+
+    confDict['pulseShape'] = [ {
+       'taur'    : 20E-9,    # rise time in (s)
+       'tauon'   : 12E-9,    # hold time in (s)
+       'tauf'    : 128E-9,   # fall time in (s)
+       'mode'    : 0,        # uni-polar pulse
+       'pheight' : -0.035    # pulse height (V) 
+      } ]
+
+#   confDict[' analysisLevel'] = 2
+
+  try: 
+    refPulseDicts=confDict['pulseShape']    
+
+    if "logFile" in confDict:
+      logFile = confDict['logFile']
+      if logFile == None: logFile = None
+    else:
+      logFile = 'pFilt'
+
+    if "logFile2" in confDict:
+      logFile2 = confDict['logFile2']
+      if logFile2 == None: logFile2 = None
+    else:
+      logFile2 = 'dpFilt'
+
+    if "rawFile" in confDict:
+      rawFile = confDict['rawFile']
+      if rawFile == None: rawFile = None
+    else:
+      rawFile = None
+
+    if "pictFile" in confDict:
+      pictDir = confDict['pictFile']
+    else:
+      pictDir = None
+        
+    if "modules" in confDict:
+      modules = confDict['modules']
+    else:
+      modules = ['RMeter','Hists']
+
+    if "NWorkers" in confDict:
+      NWorkers = confDict['NWorkers'] # number of worker processes
+    else:
+      NWorkers = 1
+
+    if "NBatch" in confDict:
+      NBatch = confDict['NBatch'] # events analysed at once
+    else:
+      NBatch = 1
+
+    if "corrMethod" in confDict:
+      corrMethod = confDict['corrMethod'] # 'auto', 'direct' or 'fft'
+    else:
+      corrMethod = 'auto'
+
+#    if "analysisLevel" in confDict:
+#      analysisLevel = confDict['analysisLevel']
+#    else:
+#      analysisLevel = 2
+
+  except:
+    print('     failed to read pulseFilter configuration ')
+    exit(1)
+
+  out = pFoutput(BM, confDict, logFile, logFile2, rawFile, pictDir,
+                 filtRateQ, hists, VSigQ, verbose)
+  search = PulseSearch(BM, refPulseDicts, verbose, corrMethod)
+
+# --- end set-up 
+
+  if NWorkers > 1:
+    pFparallel(BM, cId, NWorkers, NBatch, search, out)
+    out.close()
+    return
 
-# add summary information to log-files
-  tag = "# pulseFilter Summary: " 
-  if logf is not None:
-    if logf: 
-      print(tag+"last evNR %i, Nval, Nacc, Nacc2, Nacc3: %i, %i, %i, %i"\
-        %(evcnt, Nval, Nacc, Nacc2, Nacc3),
-          file=logf )
-      logf.close()
-
-  if logf2 is not None: 
-    print(tag+"last evNR %i, Nval, Nacc, Nacc2, Nacc3: %i, %i, %i, %i"\
-      %(evcnt, Nval, Nacc, Nacc2, Nacc3),
-        file=logf2 )
-    print("#                       %i double pulses"%(Ndble), 
-        file=logf2 )
-    logf2.close()
-
-  if rawf is not None: 
-    print("--- ", file=rawf )
-    rawf.close()
-
-  if pDir is not None:
-    # put all figures in one zip-file 
-    pass
+# set mode for Buffer Manager
+  mode = 0    # obligatory consumer, get all events
+
+# event loop, blocks of events
+  while BM.ACTIVE.value and NBatch > 1:
+    e = BM.getEvents(cId, NBatch)
+    if e is None: break
+    evNrs, evTimes, evData = e
+    rs = search.batch(BM.toVolts(evData)) # raw ADC samples to Volts
+    headers = BM.getHeaders(cId)
+    for j, r in enumerate(rs):
+      out.record(evNrs[j], evTimes[j], r, evData[j], headers[j:j+1])
+
+# event loop, single events
+  while BM.ACTIVE.value and NBatch <= 1:
+    e = BM.getEvent(cId, mode=mode)
+    if e == None:
+      break             # end if empty event or BM no longer active
+    evNr, evTime, evData = e
+    r = search(BM.toVolts(evData)) # raw ADC samples to Volts, if needed
+    out.record(evNr, evTime, r, evData, BM.getHeaders(cId))
+# end BM.ACTIVE or break e == None  
 
+  out.close()
   return
 #-end pulseFilter
+
+def pFparallel(BM, cId, NWorkers, NBatch, search, out):
+  '''
+    run pulse search in NWorkers processes, merge results in the 
+    order of events and pass them to pFoutput out
+  '''
+  # worker clients, all start with the same event
+  cIds = [cId] + [BM.BMregister() for k in range(NWorkers - 1)]
+  BM.BMjoin(cIds)
+  resQ = Queue()
+  workers = []
+  for k, c in enumerate(cIds):
+    workers.append(Process(name='pFworker%i'%(k), target=pFworker,
+                   args=(BM, c, k, NWorkers, NBatch, search, resQ) ) )
+    workers[-1].start()
+  if out.verbose:
+    BM.prlog('*==* pulseFilter: %i worker processes started'%(NWorkers))
+
+  wlast = [0] * NWorkers # last event seen by each worker
+  pending = [] # heap of results waiting for earlier events
+  NActive = NWorkers
+  while NActive:
+    try:
+      k, last, res = resQ.get(True, 0.5)
+    except Empty:
+      if not BM.ACTIVE.value: break
+      continue
+    if last is None: # worker ended
+      NActive -= 1
+      wlast[k] = float('inf')
+    else:
+      wlast[k] = last
+    for r in res: heapq.heappush(pending, r)
+    # results up to event seen by all workers are complete
+    m = min(wlast)
+    while len(pending) and pending[0][0] <= m:
+      out.record(*heapq.heappop(pending))
+  while len(pending): 
+    out.record(*heapq.heappop(pending))
+  for w in workers: w.join(1.)
@@ -136,7 +136,14 @@ if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
   print(' -> initializing PicoScope')
 
 # configure and initialize PicoScope
-  PSconf = picodaqa.picoConfig.PSconfig(PSconfdict)
+  if 'PSmodel' in PSconfdict and PSconfdict['PSmodel'] == 'replay':
+    # replay recorded run file instead of PicoScope 
+    import picodaqa.picoReplay
+    if 'RawData' in BMconfdict: # data format of buffers
+      PSconfdict['RawData'] = BMconfdict['RawData']
+    PSconf = picodaqa.picoReplay.PSreplay(PSconfdict)
+  else:
+    PSconf = picodaqa.picoConfig.PSconfig(PSconfdict)
   PSconf.init()
   # copy some of the important configuration variables ...
   NChannels = PSconf.NChannels # number of channels in use
@@ -175,7 +182,8 @@ if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
 #                       maxRate interval name
   # Voltmeter display
   if 'mpVMeter' in modules:
-    VMcidx, VMmpQ = BM.BMregister_mpQ()
+    # effective Voltages from features, if computed by BufferMan
+    VMcidx, VMmpQ = BM.BMregister_mpQ(features=BM.Features)
     procs.append(mp.Process(name='VMeter', target = mpVMeter, 
               args=(VMmpQ, PSconf.OscConfDict, 500., 'effective Voltage') ) )
 #                         config interval name
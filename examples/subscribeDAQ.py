@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# script subscribeDAQ.py
+'''
+  **subscribeDAQ** example of an independent process reading events
+    from a running data acquisition via the event server of BufferMan
+
+  start DAQ with "EventServer: /tmp/picoDAQ.sock" in BMconfig.yaml, then
+
+    python3 subscribeDAQ.py [<socket>] [oblig|random] [maxRate]
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import sys, time, numpy as np
+from picodaqa.BMserver import BMclient
+
+if __name__ == "__main__": # - - - - - - - - - - - - - - - - - - - - - -
+
+  path = '/tmp/picoDAQ.sock'
+  mode = 'random'
+  maxRate = 10.
+  if len(sys.argv) >= 2: path = sys.argv[1]
+  if len(sys.argv) >= 3: mode = sys.argv[2]
+  if len(sys.argv) >= 4: maxRate = float(sys.argv[3])
+
+  client = BMclient(path, mode, maxRate)
+  print('*==* connected to ' + path, client.conf)
+  t0 = time.time()
+  n = 0
+  while True:
+    e = client.getEvent()
+    if e is None: break
+    evNr, evTime, evData = e
+    V = client.toVolts(evData)
+    n += 1
+    if time.time() - t0 > 1.:
+      print('  event %i  t=%.3fs  rate %.3gHz  min: %s'\
+        %(evNr, evTime, n/(time.time() - t0), np.min(V, axis=1)) )
+      t0 = time.time()
+      n = 0
+  print('*==* server closed connection')
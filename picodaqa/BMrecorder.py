@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+'''
+.. module BMrecorder of picoDAQ
+
+  event recorder: obligatory consumer of BufferMan writing every
+  event, with its header, to a binary run file
+
+  layout of run file (little endian):
+
+    - file header of fixed size (RFheaderSize bytes): magic 'PDAQRUN1',
+      4-byte length and json record (NChannels, NSamples, TSampling,
+      data type, conversion to Volts, layout of event header,
+      compression, device configuration), padded with zeros
+
+    - chunks of events: 'CHNK', number of events (uint32), size of
+      payload (uint64), then the payload: event headers as in
+      BufferMan (evNr, tTrig, tDead, flags) for all events of the
+      chunk followed by the event data (int16 or float32),
+      compressed as a whole if compression is 'zlib'
+
+    - index, written when the file is closed: 'INDX', number of
+      chunks (uint64) and one entry of type RFindexType per chunk,
+      'EVTS', number of events (uint64) and one entry of type
+      RFeventType per event (event number, time, chunk, position in
+      chunk and position of data in file), followed by the positions
+      of chunk and event index (2 x uint64) and 'PDAQEND1'
+
+  events are copied from the buffer in blocks and written to disk
+  by a separate thread, so that file i/o and compression overlap
+  with data taking. Run files are read back with RunFileReader,
+  which gives access to any event, range of event numbers or time 
+  interval without reading the file.
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import sys, time, json, struct, zlib, mmap, threading, numpy as np
+if sys.version_info[0] < 3:
+  from Queue import Queue
+else:
+  from queue import Queue
+
+RFmagic = b'PDAQRUN1'
+RFendMagic = b'PDAQEND1'
+RFheaderSize = 65536 # fixed size of file header
+RFchunkHeader = struct.Struct('<4sIQ') # 'CHNK', events, payload size
+# chunk index
+RFindexType = np.dtype([('offset', '<u8'), ('size', '<u8'),
+                        ('nEv', '<u4'), ('evNr', '<i8'), ('tTrig', '<f8')],
+                       align=True)
+# event index
+RFeventType = np.dtype([('evNr', '<i8'), ('tTrig', '<f8'), ('chunk', '<u4'),
+                        ('pos', '<u4'), ('offset', '<u8')])
+
+class RunFileWriter(object):
+  '''
+  write blocks of events to a binary run file
+
+    Args:
+      fileName: name of output file
+      conf: dictionary describing the data, stored in file header;
+            may contain further information, e.g. configuration of
+            device ('OscConfDict') or analysis ('pFConf')
+      headerType: numpy type of event headers
+      compression: None or 'zlib'
+      NQueue: number of chunks waiting for the writer thread, at most
+  '''
+
+  def __init__(self, fileName, conf, headerType, compression=None,
+               NQueue=8):
+    self.fileName = fileName
+    self.compression = compression
+    if compression not in (None, 'zlib'):
+      print('*==* RunFileWriter: unknown compression ' + str(compression)
+            + ', writing uncompressed')
+      self.compression = None
+    self.headerType = headerType
+    self.f = open(fileName, 'wb')
+    conf = dict(conf)
+    conf['header'] = [list(d) for d in headerType.descr]
+    conf['compression'] = self.compression
+    js = json.dumps(conf, default=str).encode()
+    if len(js) + 12 > RFheaderSize:
+      raise ValueError('RunFileWriter: configuration too large for header')
+    self.f.write(RFmagic + struct.pack('<I', len(js)) + js)
+    self.f.write(b'\0' * (RFheaderSize - 12 - len(js)))
+    self.index = []
+    self.evIndex = []
+    self.NEvents = 0
+    self.NBytes = RFheaderSize
+    self.NBytesRaw = 0
+  # asynchronous writing
+    self.Q = Queue(NQueue)
+    self.thread = threading.Thread(target=self._writer)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def write(self, headers, data):
+    '''queue a chunk of events (arrays not to be modified afterwards)'''
+    self.Q.put((headers, data))
+
+  def _writer(self):
+    while True:
+      chunk = self.Q.get()
+      if chunk is None: break
+      self._writeChunk(*chunk)
+
+  def _writeChunk(self, headers, data):
+    n = len(headers)
+    if self.compression == 'zlib':
+      c = zlib.compressobj(1) # fast compression
+      payload = [c.compress(headers.tobytes()), c.compress(data.tobytes()),
+                 c.flush()]
+    else:
+      payload = [headers.view(np.uint8), data.reshape(-1).view(np.uint8)]
+    size = sum(len(p) for p in payload)
+    self.index.append((self.NBytes, size, n, headers['evNr'][0],
+                       headers['tTrig'][0]))
+    ev = np.empty(n, RFeventType)
+    ev['evNr'] = headers['evNr']
+    ev['tTrig'] = headers['tTrig']
+    ev['chunk'] = len(self.index) - 1
+    ev['pos'] = np.arange(n)
+    # position of data in file (in decompressed chunk if compressed)
+    ev['offset'] = (0 if self.compression else 
+                    self.NBytes + RFchunkHeader.size) \
+        + headers.nbytes + np.arange(n) * (data.nbytes // n)
+    self.evIndex.append(ev)
+    self.f.write(RFchunkHeader.pack(b'CHNK', n, size))
+    for p in payload: self.f.write(p)
+    self.NEvents += n
+    self.NBytes += RFchunkHeader.size + size
+    self.NBytesRaw += headers.nbytes + data.nbytes
+
+  def close(self):
+    '''write pending chunks and index, close file'''
+    self.Q.put(None)
+    self.thread.join()
+    idx = np.array(self.index, dtype=RFindexType)
+    self.f.write(b'INDX' + struct.pack('<Q', len(idx)))
+    self.f.write(idx.tobytes())
+    oev = self.NBytes + 12 + idx.nbytes
+    self.f.write(b'EVTS' + struct.pack('<Q', self.NEvents))
+    for ev in self.evIndex: self.f.write(ev.tobytes())
+    self.f.write(struct.pack('<QQ', self.NBytes, oev) + RFendMagic)
+    self.f.close()
+
+def runFileConf(BM, **kwargs):
+  '''
+  description of event data of BufferMan BM for header of run file,
+  further entries may be given as keyword arguments
+  '''
+  conf = {'NChannels': BM.NChannels, 'NSamples': BM.NSamples,
+          'TSampling': BM.TSampling, 'dtype': BM.BMdtype,
+          'VScale': None if BM.VScale is None else BM.VScale.ravel().tolist(),
+          'VOffset': None if BM.VOffset is None else
+                       BM.VOffset.ravel().tolist(),
+          'date': time.strftime('%y-%m-%d %H:%M'),
+          'OscConfDict': BM.DevConf.OscConfDict}
+  conf.update(kwargs)
+  return conf
+
+def mpBMrecorder(BM, cid, fileName, compression=None, NChunk=None,
+                 stopEvent=None, doneEvent=None, tFlush=1.):
+  '''
+  event recorder, runs as sub-process of BufferMan
+
+    Args:
+      BM: Buffer Manager instance
+      cid: client index of obligatory consumer
+      fileName: name of run file
+      compression: None or 'zlib'
+      NChunk: number of events per chunk, default: chunks of ~4 MB
+      stopEvent: multiprocessing.Event, set by BufferMan.stop()
+      doneEvent: multiprocessing.Event, set when file is closed
+      tFlush: write incomplete chunk after tFlush seconds
+  '''
+  w = RunFileWriter(fileName, runFileConf(BM), BM.header.dtype, compression)
+  evShape = (BM.NChannels, BM.NSamples)
+  if NChunk is None:
+    NChunk = max(1, (4 << 20) // (BM.BMbuf[0].nbytes + BM.header.itemsize))
+  # allocate chunk buffers
+  def newChunk():
+    return (np.empty(NChunk, BM.header.dtype),
+            np.empty((NChunk,) + evShape, BM.BMbuf.dtype))
+  hdrs, data = newChunk()
+  k = 0  # events in current chunk
+  tChunk = 0. # time of first event in chunk
+  wakeup = BM.clientWakeups[cid]
+  stopping = lambda: stopEvent is not None and stopEvent.is_set()
+  while BM.ACTIVE.value:
+    # wait for events, or for stop signal
+    available = lambda: BM.head.value > BM.Ccursor[cid]
+    wakeup.wait(lambda: not BM.ACTIVE.value or stopping() or available(),
+                tChunk + tFlush if k else None)
+    if available():
+      e = BM.getEvents(cid, NChunk - k, 0.)
+      if e is None: break
+      n = len(e[0])
+      if not k: tChunk = time.time()
+      hdrs[k:k+n] = BM.getHeaders(cid)
+      data[k:k+n] = e[2]
+      BM.releaseEvents(cid) # copied, buffer slots may be re-used
+      k += n
+    elif stopping(): # all events recorded
+      break
+    if k == NChunk or (k and time.time() - tChunk > tFlush):
+      w.write(hdrs[:k], data[:k])
+      hdrs, data = newChunk()
+      k = 0
+  if k: w.write(hdrs[:k], data[:k])
+  BM.BMunregister(cid)
+  w.close()
+  if BM.verbose:
+    BM.prlog('*==* BMrecorder: %i events written to %s, %.1f MB (%.0f%%)'\
+      %(w.NEvents, fileName, w.NBytes/1E6,
+        100.*w.NBytes/max(1, w.NBytesRaw + RFheaderSize)) )
+  if doneEvent is not None: doneEvent.set()
+
+class RunFileReader(object):
+  '''
+  read a run file written by RunFileWriter
+
+    the file is memory-mapped and only the parts needed are read;
+    events are located via the event index, so that opening a file 
+    and accessing any event takes constant time, independent of the
+    size of the file. Event headers and data of uncompressed files
+    are returned as views of the file, compressed chunks are 
+    decompressed on access (the last one is kept).
+
+    Args:
+      fileName: name of run file
+
+    Attributes:
+      conf: dictionary from file header 
+      evIndex: event index, structured array of type RFeventType
+      NEvents: number of events
+  '''
+
+  def __init__(self, fileName):
+    self.fileName = fileName
+    self.f = open(fileName, 'rb')
+    self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+    if self.mm[:8] != RFmagic:
+      raise ValueError('RunFileReader: %s is not a run file' % fileName)
+    n = struct.unpack('<I', self.mm[8:12])[0]
+    self.conf = json.loads(self.mm[12:12+n].decode())
+    self.NChannels = self.conf['NChannels']
+    self.NSamples = self.conf['NSamples']
+    self.TSampling = self.conf['TSampling']
+    self.headerType = np.dtype([tuple(d) for d in self.conf['header']])
+    self.dtype = np.dtype(self.conf['dtype'])
+    self.compression = self.conf['compression']
+    if self.conf['VScale'] is not None:
+      self.VScale = np.array(self.conf['VScale'],
+                             dtype=np.float32).reshape(-1, 1)
+      self.VOffset = np.array(self.conf['VOffset'],
+                              dtype=np.float32).reshape(-1, 1)
+    else:
+      self.VScale = None
+      self.VOffset = None
+    self.evShape = (self.NChannels, self.NSamples)
+    self.cached = (None, None)
+    self.index, self.evIndex = self._readIndex()
+    self.NChunks = len(self.index)
+    self.NEvents = len(self.evIndex)
+
+  def _readIndex(self):
+    '''chunk and event index from end of file, or by scanning chunks'''
+    mm = self.mm
+    L = len(mm)
+    if L >= RFheaderSize + 48 and mm[L-8:] == RFendMagic:
+      io, oev = struct.unpack('<QQ', mm[L-24:L-8])
+      n = struct.unpack('<Q', mm[io+4:io+12])[0]
+      nev = struct.unpack('<Q', mm[oev+4:oev+12])[0]
+      return (np.frombuffer(mm, RFindexType, n, io+12),
+              np.frombuffer(mm, RFeventType, nev, oev+12))
+    # file not closed properly, reconstruct index
+    print('*==* RunFileReader: no index in %s, scanning chunks'
+          % self.fileName)
+    idx = []
+    o = RFheaderSize
+    while o + RFchunkHeader.size <= L:
+      magic, nEv, size = RFchunkHeader.unpack_from(mm, o)
+      if magic != b'CHNK' or o + RFchunkHeader.size + size > L: break
+      idx.append((o, size, nEv, 0, 0.))
+      o += RFchunkHeader.size + size
+    idx = np.array(idx, dtype=RFindexType)
+    self.index = idx
+    evIdx = np.empty(idx['nEv'].sum(), RFeventType)
+    i = 0
+    nevb = self.NChannels * self.NSamples * self.dtype.itemsize
+    for ic, (o, size, nEv) in enumerate(
+                 zip(idx['offset'], idx['size'], idx['nEv'])):
+      h = self.chunk(ic)[0]
+      idx['evNr'][ic], idx['tTrig'][ic] = h['evNr'][0], h['tTrig'][0]
+      ev = evIdx[i:i+nEv]
+      ev['evNr'], ev['tTrig'] = h['evNr'], h['tTrig']
+      ev['chunk'], ev['pos'] = ic, np.arange(nEv)
+      ev['offset'] = (0 if self.compression else o + RFchunkHeader.size) \
+          + h.nbytes + np.arange(nEv) * nevb
+      i += nEv
+    self.cached = (None, None)
+    return idx, evIdx
+
+  def _payload(self, offset, nEv, size):
+    o = offset + RFchunkHeader.size
+    if self.compression == 'zlib':
+      return zlib.decompress(self.mm[o:o+size])
+    return memoryview(self.mm)[o:o+size]
+
+  def chunk(self, i):
+    '''
+    Returns:
+      headers, data of events in chunk i;
+      data are of shape (nEv, NChannels, NSamples)
+    '''
+    if self.cached[0] == i: return self.cached[1]
+    o, size, nEv = [int(x) for x in
+                    (self.index['offset'][i], self.index['size'][i],
+                     self.index['nEv'][i])]
+    p = self._payload(o, nEv, size)
+    nh = nEv * self.headerType.itemsize
+    c = (np.frombuffer(p, self.headerType, nEv),
+         np.frombuffer(p, self.dtype, nEv * self.NChannels * self.NSamples,
+                       nh).reshape((nEv,) + self.evShape))
+    if self.compression: self.cached = (i, c)
+    return c
+
+  def __len__(self):
+    return self.NEvents
+
+  def event(self, i):
+    '''
+    Returns: 
+      header and data (shape (NChannels, NSamples)) of i-th event
+    '''
+    e = self.evIndex[i]
+    h, d = self.chunk(int(e['chunk']))
+    return h[e['pos']], d[e['pos']]
+
+  def events(self, i0, i1):
+    '''
+    events i0 to i1 (excluding i1)
+
+      Returns:
+        headers and data (shape (n, NChannels, NSamples)), as views of
+        the file if all events are in the same chunk, else as copies
+    '''
+    i0, i1, _ = slice(i0, i1).indices(self.NEvents)
+    if i1 <= i0:
+      return (np.empty(0, self.headerType), 
+              np.empty((0,) + self.evShape, self.dtype))
+    e0, e1 = self.evIndex[i0], self.evIndex[i1-1]
+    c0, c1 = int(e0['chunk']), int(e1['chunk'])
+    if c0 == c1:
+      h, d = self.chunk(c0)
+      return h[e0['pos']:e1['pos']+1], d[e0['pos']:e1['pos']+1]
+    hs, ds = [], []
+    for c in range(c0, c1+1):
+      h, d = self.chunk(c)
+      p0 = e0['pos'] if c == c0 else 0
+      p1 = e1['pos']+1 if c == c1 else len(h)
+      hs.append(h[p0:p1])
+      ds.append(d[p0:p1])
+    return np.concatenate(hs), np.concatenate(ds)
+
+  def evNrRange(self, n0, n1):
+    '''events with event numbers n0 <= evNr < n1, see events()'''
+    evNr = self.evIndex['evNr']
+    return self.events(np.searchsorted(evNr, n0), np.searchsorted(evNr, n1))
+
+  def timeRange(self, t0, t1):
+    '''events with trigger times t0 <= tTrig < t1, see events()'''
+    tTrig = self.evIndex['tTrig']
+    return self.events(np.searchsorted(tTrig, t0), 
+                       np.searchsorted(tTrig, t1))
+
+  def toVolts(self, evData):
+    '''convert raw ADC samples to Volts'''
+    if self.VScale is None: return evData
+    return evData * self.VScale - self.VOffset
+
+  def close(self):
+    self.cached = (None, None)
+    self.index, self.evIndex = None, None
+    try:
+      self.mm.close()
+    except BufferError: # views still in use, released with them
+      pass
+    self.f.close()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+'''
+.. module BMserver of picoDAQ
+
+  event server: publish events of BufferMan on a local Unix-domain
+  socket, so that independent processes (analysis programs, notebooks)
+  can subscribe to a running data acquisition
+
+  protocol:
+
+    - subscriber sends one line: "oblig" or "random [maxRate]"
+    - server answers with a configuration record: 4-byte length
+      followed by json (NChannels, NSamples, TSampling, data type,
+      conversion to Volts, layout of event header)
+    - then one frame per event, of fixed size: event header as in
+      BufferMan (evNr, tTrig, tDead, flags) followed by the event data
+      as stored in the buffer (int16 ADC counts or float32 Volts)
+
+  "oblig" subscribers are obligatory consumers, i.e. data acquisition
+  waits until the event was sent; "random" subscribers get the latest
+  event whenever they are ready, at most maxRate times per second.
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import os, time, json, struct, socket, threading, numpy as np
+
+def mpBMserver(BM, path):
+  '''
+  event server, runs as sub-process of BufferMan
+
+    Args:
+      BM: Buffer Manager instance
+      path: name of Unix-domain socket
+  '''
+  if os.path.exists(path): os.unlink(path)
+  srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  srv.bind(path)
+  srv.listen(4)
+  srv.settimeout(0.5)
+  while BM.ACTIVE.value:
+    try:
+      conn, addr = srv.accept()
+    except socket.timeout:
+      continue
+    thr = threading.Thread(target=serveClient, args=(BM, conn))
+    thr.daemon = True
+    thr.start()
+  srv.close()
+  if os.path.exists(path): os.unlink(path)
+
+def serveClient(BM, conn):
+  '''send events to one subscriber'''
+  conn.settimeout(None)
+  try:
+    req = conn.makefile('rb').readline().decode().split()
+  except (IOError, OSError, UnicodeDecodeError):
+    conn.close()
+    return
+  mode = req[0] if len(req) else 'random'
+  maxRate = float(req[1]) if len(req) > 1 else 0.
+  conf = {'NChannels': BM.NChannels, 'NSamples': BM.NSamples,
+          'TSampling': BM.TSampling, 'dtype': BM.BMdtype,
+          'VScale': None if BM.VScale is None else BM.VScale.ravel().tolist(),
+          'VOffset': None if BM.VOffset is None else
+                       BM.VOffset.ravel().tolist(),
+          'header': [list(d) for d in BM.header.dtype.descr],
+          'mode': mode}
+  cid = BM.BMregister()
+  if BM.verbose:
+    BM.prlog('*==* BMserver: new subscriber, %s, client id=%i'%(mode, cid))
+  try:
+    js = json.dumps(conf).encode()
+    conn.sendall(struct.pack('<I', len(js)) + js)
+    tlast = 0.
+    while BM.ACTIVE.value:
+      if mode == 'oblig':
+        e = BM.getEvent(cid, mode=0)
+        if e is None: break
+        # event is held until next request, send directly from buffer
+        conn.sendall(BM.getHeaders(cid).tobytes())
+        conn.sendall(memoryview(np.ascontiguousarray(e[2])).cast('B'))
+      else:
+        if maxRate > 0.: # rate limit
+          dt = tlast + 1./maxRate - time.time()
+          if dt > 0.: time.sleep(dt)
+        tlast = time.time()
+        e = BM.getEvent(cid, mode=3) # zero-copy reference
+        if e is None: break
+        ibr, seq = BM.evRefs[cid]
+        hdr = BM.header[ibr:ibr+1].tobytes()
+        evData = np.array(e[2])
+        if not BM.isValid(cid): continue # overwritten while copying
+        conn.sendall(hdr)
+        conn.sendall(evData.tobytes())
+  except (IOError, OSError):
+    pass # subscriber disconnected
+  BM.BMunregister(cid)
+  conn.close()
+
+class BMclient(object):
+  '''
+  subscriber to the event server of BufferMan
+
+    Args:
+      path: name of Unix-domain socket of server
+      mode: 'oblig' or 'random'
+      maxRate: maximum event rate for random subscribers (0. for no limit)
+  '''
+
+  def __init__(self, path, mode='random', maxRate=0.):
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(path)
+    self.sock.sendall(('%s %g\n'%(mode, maxRate)).encode())
+    n = struct.unpack('<I', self._recv(4))[0]
+    self.conf = json.loads(self._recv(n).decode())
+    self.NChannels = self.conf['NChannels']
+    self.NSamples = self.conf['NSamples']
+    self.TSampling = self.conf['TSampling']
+    self.headerType = np.dtype([tuple(d) for d in self.conf['header']])
+    self.dtype = np.dtype(self.conf['dtype'])
+    if self.conf['VScale'] is not None:
+      self.VScale = np.array(self.conf['VScale'],
+                             dtype=np.float32).reshape(-1, 1)
+      self.VOffset = np.array(self.conf['VOffset'],
+                              dtype=np.float32).reshape(-1, 1)
+    else:
+      self.VScale = None
+    # receive buffer for one frame, and views of header and data
+    nh = self.headerType.itemsize
+    self.frame = bytearray(nh +
+                   self.NChannels * self.NSamples * self.dtype.itemsize)
+    self.header = np.frombuffer(self.frame, self.headerType, count=1)
+    self.data = np.frombuffer(self.frame, self.dtype, offset=nh).reshape(
+                  self.NChannels, self.NSamples)
+
+  def _recv(self, n):
+    b = bytearray(n)
+    self._recv_into(memoryview(b))
+    return bytes(b)
+
+  def _recv_into(self, mv):
+    while len(mv):
+      k = self.sock.recv_into(mv)
+      if k == 0: raise EOFError('BMclient: server closed connection')
+      mv = mv[k:]
+
+  def getEvent(self):
+    '''
+    Returns:
+      event number, event time, event data
+      (view of receive buffer, valid until next call)
+    '''
+    try:
+      self._recv_into(memoryview(self.frame))
+    except (EOFError, IOError, OSError):
+      return None
+    h = self.header[0]
+    return int(h['evNr']), float(h['tTrig']), self.data
+
+  def getHeader(self):
+    '''Returns: header of last event (evNr, tTrig, tDead, flags)'''
+    return self.header[0]
+
+  def toVolts(self, evData):
+    '''convert raw ADC samples to Volts'''
+    if self.VScale is None: return evData
+    return evData * self.VScale - self.VOffset
+
+  def close(self):
+    self.sock.close()
@@ -8,13 +8,175 @@ from __future__ import print_function, division, unicode_literals
 from __future__ import absolute_import
 
 # - class BufferMan
-import numpy as np, sys, time, threading
+import numpy as np, sys, time, threading, math
 
-from multiprocessing import Queue, Process, Array
+from multiprocessing import Queue, Process, Array, Semaphore, Lock, Event
 from multiprocessing.sharedctypes import RawValue, RawArray
+if sys.version_info[0] < 3:
+  from Queue import Empty, Full
+else:
+  from queue import Empty, Full
 
 from .mpBufManCntrl import *
 from .mpOsci import * 
+from .BMserver import mpBMserver
+from .BMrecorder import mpBMrecorder
+
+# header of each event in shared memory
+BMheaderType = np.dtype([
+  ('evNr', np.int64),     # event number
+  ('tTrig', np.float64),  # trigger time (s) since start of run
+  ('tDead', np.float32),  # dead time (s) before read-out of event 
+  ('flags', np.uint32)])  # bits 0-3: ADC overflow in channel A-D,
+                          # bit 8: gap in data stream before event
+
+# features of each event and channel in shared memory (in Volts), 
+#   computed once by the producer if configured
+BMfeatureType = np.dtype([
+  ('baseline', np.float32), # mean of samples before trigger
+  ('mean', np.float32),     # mean of all samples
+  ('rms', np.float32),      # root mean square of all samples
+  ('min', np.float32),      # minimum 
+  ('max', np.float32),      # maximum
+  ('peak', np.int32),       # index of largest deviation from baseline
+  ('integral', np.float32)]) # integral above baseline (Vs)
+
+class BMwakeup(object):
+  '''
+  wake-up signal between threads and processes of BufferMan
+
+  A waiter blocks on a semaphore in shared memory instead of polling;
+  the semaphore is only posted if the waiter has announced itself, 
+  so no wake-up tokens pile up while nobody is waiting. The waiting 
+  condition is re-checked after every wake-up, and the time-out 
+  limits the delay should a notification ever get lost. 
+  Only one thread or process should wait on a given instance.
+  '''
+
+  def __init__(self, timeout=0.1):
+    self.sem = Semaphore(0)
+    self.waiting = RawValue('b', 0)
+    self.timeout = timeout
+
+  def notify(self):
+    '''wake up waiting thread or process, if any'''
+    if self.waiting.value:
+      self.waiting.value = 0
+      self.sem.release()
+
+  def wait(self, condition, tmax=None):
+    '''block until condition() is true
+
+       Args: 
+         condition: function returning True when waiting is over
+         tmax: give up at this time (as returned by time.time())
+    '''
+    while not condition():
+      self.waiting.value = 1
+      if condition(): # re-check after announcing waiter
+        break
+      dt = self.timeout
+      if tmax is not None:
+        dt = min(dt, tmax - time.time())
+        if dt <= 0.: break
+      self.sem.acquire(True, dt)
+    self.waiting.value = 0
+
+class BMslotQue(object):
+  '''
+  zero-copy event delivery to a sub-process
+
+  Queue-like object returned by BufferMan.BMregister_mpQ(zerocopy=True):
+  only a reference (evNr, evTime, buffer slot, sequence number) is passed 
+  through the multiprocessing Queue, the waveform is copied directly 
+  from the shared buffer space of BufferMan. The generation counter of 
+  the slot, i.e. the sequence number of the event it holds, is checked 
+  before and after copying; events overwritten by the producer in the
+  meantime are discarded and counted as lost.
+  '''
+
+  def __init__(self, Q, CBMbuf, CslotSeq, shape, dtype='f', 
+               VScale=None, VOffset=None):
+    self.Q = Q
+    self.CBMbuf = CBMbuf
+    self.CslotSeq = CslotSeq
+    self.shape = shape
+    self.dtype = dtype
+    self.VScale = VScale   # conversion of raw ADC samples to Volts
+    self.VOffset = VOffset
+    self.BMbuf = None  # numpy view, created in receiving process
+    self.Nlost = 0     # number of overwritten events
+
+  def put(self, evRef, block=True, timeout=None):
+    self.Q.put(evRef, block, timeout)
+
+  def empty(self):
+    return self.Q.empty()
+
+  def qsize(self):
+    return self.Q.qsize()
+
+  def get(self, block=True, timeout=None):
+    '''Returns: event number, event time, copy of event data'''
+    if self.BMbuf is None:
+      self.BMbuf = np.frombuffer(self.CBMbuf, self.dtype).reshape(self.shape)
+    while True:
+      evNr, evTime, ibuf, seq = self.Q.get(block, timeout)
+      if self.CslotSeq[ibuf] == seq: 
+        evData = np.array(self.BMbuf[ibuf]) # one copy from shared memory
+        if self.CslotSeq[ibuf] == seq: # not overwritten while copying
+          if self.VScale is not None: # convert raw samples to Volts
+            evData = np.multiply(evData, self.VScale, dtype=np.float32)
+            evData -= self.VOffset
+          return evNr, evTime, evData
+      self.Nlost += 1
+
+class BMlatency(object):
+  '''
+  histograms of time differences in shared memory
+
+  one histogram per stage of the data flow with logarithmic bins,
+  NperDecade bins per decade from tmin; first and last bin hold
+  under- and overflows. Each histogram must only be filled by
+  one thread or process, so no locking is needed.
+  '''
+
+  def __init__(self, names, tmin=1E-6, NDecades=7, NperDecade=10):
+    self.names = names
+    self.tmin = tmin
+    self.NperDecade = NperDecade
+    self.NBins = NDecades*NperDecade + 2
+    self.Chist = RawArray('i', len(names) * self.NBins)
+    self.hist = None  # numpy view, created in process using it
+
+  def fill(self, i, dt):
+    '''add time difference dt (s) to histogram i'''
+    if dt > 0.:
+      ib = int(math.log10(dt/self.tmin)*self.NperDecade) + 1
+      ib = min(max(ib, 0), self.NBins - 1)
+    else:
+      ib = 0
+    self.Chist[i*self.NBins + ib] += 1
+
+  def quantiles(self, i, q=(0.5, 0.99)):
+    '''Returns: number of entries and quantiles (s) of histogram i'''
+    if self.hist is None:
+      self.hist = np.frombuffer(self.Chist, 'i').reshape(-1, self.NBins)
+    h = self.hist[i]
+    n = h.sum()
+    if n == 0: return 0, None
+    c = np.cumsum(h)
+    # upper edge of bin containing quantile
+    ibs = [np.searchsorted(c, qi*n) for qi in q]
+    return n, [self.tmin * 10.**(ib/self.NperDecade) for ib in ibs]
+
+  def summary(self):
+    '''Returns: dictionary stage: (entries, p50, p99) for filled stages'''
+    d = {}
+    for i, name in enumerate(self.names):
+      n, tq = self.quantiles(i)
+      if n: d[name] = (int(n), tq[0], tq[1])
+    return d
 
 class BufferMan(object):
   '''
@@ -26,6 +188,10 @@ class BufferMan(object):
   is paused until all consumcers are done) and random consumers
   (receive an event copy, data acquisition continues regardless
   of the consumers' progress)
+
+  Obligatory consumers read the ring buffer through their own
+  cursors and may work on different events at the same time; 
+  a buffer slot is only re-used after all cursors have passed it.
   '''
 
   def __init__(self, BMdict, DevConf):
@@ -35,9 +201,17 @@ class BufferMan(object):
  
     # read configuration dictionary
     if "NBuffers" in BMdict: 
-      self.NBuffers = BMdict["NBuffers"] # number of buffers
+      self.NBuffers = BMdict["NBuffers"] # number of buffers, or 'auto'
     else:
       self.NBuffers= 16
+    if "BufferMemory" in BMdict: 
+      self.BufferMemory = BMdict["BufferMemory"] # memory budget in MB
+    else:
+      self.BufferMemory = 64.
+    if "NBuffersMax" in BMdict: 
+      self.NBuffersMax = BMdict["NBuffersMax"] # limit for NBuffers: auto
+    else:
+      self.NBuffersMax = 1024 # e.g. 1s of data at 1kHz
     if "BMmodules" in BMdict: 
       self.BMmodules = BMdict["BMmodules"] # display modules to start
     else:
@@ -55,6 +229,38 @@ class BufferMan(object):
       self.logTime = BMdict["logTime"] # time between logging entries
     else:
       self.logTime = 60 # logging information once per 60 sec
+    if "MaxClients" in BMdict: 
+      self.MaxClients = BMdict["MaxClients"] # max. number of clients
+    else:
+      self.MaxClients = 16
+    if "RawData" in BMdict: 
+      self.RawData = BMdict["RawData"] # store raw int16 ADC samples
+    else:
+      self.RawData = False # store samples converted to Volts
+    if "ZeroCopy" in BMdict: 
+      self.ZeroCopy = BMdict["ZeroCopy"] # default for mpQ consumers
+    else:
+      self.ZeroCopy = False # send copy of event data through mpQ
+    if "EventServer" in BMdict: 
+      self.EventServer = BMdict["EventServer"] # Unix socket for subscribers
+    else:
+      self.EventServer = None
+    if "Timing" in BMdict: 
+      self.Timing = BMdict["Timing"] # latency histograms per stage
+    else:
+      self.Timing = False
+    if "RecordFile" in BMdict: 
+      self.RecordFile = BMdict["RecordFile"] # record events to run file
+    else:
+      self.RecordFile = None
+    if "RecordCompression" in BMdict: 
+      self.RecordCompression = BMdict["RecordCompression"] # None or 'zlib'
+    else:
+      self.RecordCompression = None
+    if "Features" in BMdict: 
+      self.Features = BMdict["Features"] # per-event feature cache
+    else:
+      self.Features = False
 
 # read device congiguration and set up Buffer space
     self.DevConf = DevConf  
@@ -62,50 +268,156 @@ class BufferMan(object):
     self.NSamples = DevConf.NSamples   # number of samples 
     self.TSampling = DevConf.TSampling # sampling interval
 
+# size of ring buffer from memory budget
+    slotSize = self.NChannels * self.NSamples * (2 if self.RawData else 4)\
+                 + BMheaderType.itemsize
+    if self.Features: slotSize += self.NChannels * BMfeatureType.itemsize
+    maxNBuffers = int(self.BufferMemory * 2**20 / slotSize)
+    if self.NBuffers == 'auto':
+      # deep enough for bursts, but limited for short traces; 
+      #   rates are not known before the run, see recommendNBuffers() 
+      self.NBuffers = max(min(maxNBuffers, self.NBuffersMax), 4)
+      if self.verbose: 
+        print('      BufferMan: %i buffers of %.3gkB (%.3gMB)'\
+          %(self.NBuffers, slotSize/1024., self.NBuffers*slotSize/2.**20) )
+    elif self.NBuffers > maxNBuffers:
+      print('!!! BufferMan: %i buffers need %.3gMB, more than BufferMemory'\
+         %(self.NBuffers, self.NBuffers*slotSize/2.**20) )
+    self.maxNBuffers = max(maxNBuffers, self.NBuffers)
+
     # function collecting data from hardware device
-    self.rawDAQproducer = DevConf.acquireDataBM 
+    if hasattr(DevConf, 'NCaptures') and DevConf.NCaptures > 1:
+      # rapid-block mode, device delivers NCaptures events per read-out
+      self.NCaptures = DevConf.NCaptures
+      self.rawDAQproducer = DevConf.acquireDataBMbulk
+      if self.NCaptures > self.NBuffers:
+        print('!!! BufferMan: NBuffers must not be smaller than NCaptures') 
+        sys.exit(1)
+    else:
+      self.NCaptures = 1
+      self.rawDAQproducer = DevConf.acquireDataBM 
+
+# data format: raw ADC samples or Volts
+    if self.RawData:
+      self.BMdtype = 'h' # int16
+    # per-channel conversion to Volts: V = raw * VScale - VOffset
+      self.VScale = np.array(DevConf.rawScale, 
+                             dtype=np.float32).reshape(self.NChannels, 1)
+      self.VOffset = np.array(DevConf.rawOffset, 
+                             dtype=np.float32).reshape(self.NChannels, 1)
+    else:
+      self.BMdtype = 'f' # float32
+      self.VScale = None
+      self.VOffset = None
 
 # data structure for BufferManager in shared c-type memory ...
-    self.CBMbuf = RawArray('f', 
+    self.CBMbuf = RawArray(self.BMdtype, 
                   self.NBuffers * self.NChannels * self.NSamples) 
-    self.CtimeStamp = RawArray('f', self.NBuffers )
-    self.CtrigStamp = RawArray('i', self.NBuffers )
+    self.Cheader = RawArray('q', self.NBuffers * BMheaderType.itemsize//8)
 #  ... and map to numpy arrays
-    self.BMbuf = np.frombuffer(self.CBMbuf, 'f').reshape(self.NBuffers, 
-        self.NChannels, self.NSamples)
-    self.timeStamp = np.frombuffer(self.CtimeStamp, 'f')
-    self.trigStamp = np.frombuffer(self.CtrigStamp, 'f')
-
-    self.ibufr = RawValue('i', -1) # read index, synchronization with producer 
+    self.BMbuf = np.frombuffer(self.CBMbuf, self.BMdtype).reshape(
+        self.NBuffers, self.NChannels, self.NSamples)
+    self.header = np.frombuffer(self.Cheader, BMheaderType)
+    self.trigStamp = self.header['evNr'] # views of header fields
+    self.timeStamp = self.header['tTrig']
+
+# optional per-event features, next to each buffer slot
+    if self.Features:
+      self.Cfeatures = RawArray('i', 
+        self.NBuffers * self.NChannels * BMfeatureType.itemsize//4)
+      self.features = np.frombuffer(self.Cfeatures, BMfeatureType).reshape(
+        self.NBuffers, self.NChannels)
+      # baseline from samples before trigger, or from start of trace
+      pretrig = DevConf.pretrig if hasattr(DevConf, 'pretrig') else 0.
+      if pretrig > 0.:
+        self.NBaseline = max(int(self.NSamples * pretrig), 1)
+      else:
+        self.NBaseline = max(self.NSamples//10, 1)
+    else:
+      self.Cfeatures = None
+      self.features = None
+
+# ring buffer of event slots: cursors count events, 
+#   slot index is cursor % NBuffers, buffer filling level is head - tail
+    self.head = RawValue('q', 0) # next event to be written by producer
+    self.tail = RawValue('q', 0) # next event to be released by manager
+# generation counter per slot (seqlock): sequence number of stored event,
+#   -1 while the producer is writing to the slot
+    self.CslotSeq = RawArray('q', self.NBuffers)
+    for i in range(self.NBuffers): 
+      self.CslotSeq[i] = -1
+# read cursors of obligatory consumers 
+    self.Ccursor = RawArray('q', self.MaxClients) # next event of client
+    self.Cheld = RawArray('i', self.MaxClients)   # events held by client
+    self.Cgating = RawArray('b', self.MaxClients) # 1 if obligatory consumer
+
+# wake-up signals instead of polling
+    self.syncTimeout = 0.1   # max. time (s) to block before checking status
+    self.prodWakeup = BMwakeup(self.syncTimeout) # producer waiting for buffer
+    self.mgrWakeup = BMwakeup(self.syncTimeout)  # manager waiting for event
+    self.clientWakeups = [BMwakeup(self.syncTimeout) # clients waiting
+                          for i in range(self.MaxClients)]
+
+# optional time stamps of data flow and latency histograms 
+#   trigger ready -> filled -> published -> delivered -> released
+    if self.Timing:
+      self.CtReady = RawArray('d', self.NBuffers)   # trigger ready
+      self.CtFilled = RawArray('d', self.NBuffers)  # buffer filled
+      self.CtPublish = RawArray('d', self.NBuffers) # published by producer
+      self.CtDeliver = RawArray('d', self.MaxClients) # delivered to client
+      self.latency = BMlatency(['readout', 'publish', 'manager'] + 
+        ['deliver %i'%c for c in range(self.MaxClients)] + 
+        ['hold %i'%c for c in range(self.MaxClients)] +
+        ['mpQ %i'%c for c in range(self.MaxClients)] )
 
 # global variables for producer statistics
     self.Ntrig = RawValue('i', 0)     # count number of readings
-    self.Ttrig = RawValue('f', 0.)    # time of last event
+    self.Ttrig = RawValue('d', 0.)    # time of last event
     self.Tlife = RawValue('f', 0.)    # DAQ lifetime
     self.readrate = RawValue('f', 0.) # current rate                
     self.lifefrac = RawValue('f', 0.) # current life-time
     self.BMT0 = RawValue('d', 0.)     # time of run-start
+    self.NbufFull = RawValue('i', 0)  # read-outs waiting for free buffer
+    self.TbufFull = RawValue('d', 0.) # time spent waiting for free buffer
 
 # set up variables for Buffer Manager status and accounting  
     self.tPause = 0.  # time when last paused
     self.dTPause = 0. # total time spent in paused state
+    self.TStop = 0.   # time when stopped
+    self.recStop = None # signals to event recorder
+    self.recDone = None
     self.ACTIVE = RawValue('b', 0) 
     self.RUNNING = RawValue('b', 0)
     self.STOPPED = False
 
+# client registry in shared memory: all resources are allocated here, 
+#   before any sub-process is started, so that clients can attach 
+#   to and detach from a running Buffer Manager
+    self.BMlock = Lock()  # protects registry, used by many processes
+    self.registryGen = RawValue('i', 0) # incremented at every change 
   # queues ( multiprocessing Queues for communication with sub-processes)
-    self.prod_Que = Queue(self.NBuffers) # acquireData <-> manageDataBuffer
-    self.request_Ques=[] # consumer request to manageDataBuffer
-                # 0:  request event pointer, obligatory consumer
+    self.request_Ques = [Queue(1) for i in range(self.MaxClients)]
+                # consumer request to manageDataBuffer
                 # 1:  request event data, random consumer 
-                # 2:  request event data, obligatoray consumer
-    self.consumer_Ques=[] # data from manageDataBuffer to consumer
+                # 3:  request event pointer, random consumer
+    self.consumer_Ques = [Queue(1) for i in range(self.MaxClients)] 
+                # data from manageDataBuffer to consumer
+    self.CclientUsed = RawArray('b', self.MaxClients) # slot in use
+    self.NclientSlots = RawValue('i', 0) # highest slot used + 1
 
   # multiprocessing Queues for data transfer to subprocesses
-    self.mpQues = []
+    self.mpQues = [Queue(1) for i in range(self.MaxClients)]
+    self.CmpQused = RawArray('b', self.MaxClients) # slot in use
+    self.CmpQzc = RawArray('b', self.MaxClients) # zero-copy delivery
+    self.CmpQlatest = RawArray('b', self.MaxClients) # policy 'latest'
+    self.CmpQprescale = RawArray('i', self.MaxClients) # offer every n-th 
+    self.CmpQdtmin = RawArray('d', self.MaxClients) # 1/maximum rate
+    self.CmpQdeliv = RawArray('q', self.MaxClients) # delivered events
+    self.CmpQdrop = RawArray('q', self.MaxClients)  # dropped events
+    self.CmpQfeat = RawArray('b', self.MaxClients) # features instead of data
+    self.evRefs = {} # slot and sequence number of zero-copy events 
     self.BMInfoQue = None
 
-    self.BMlock = threading.Lock() 
     self.logQ = None
 
  # keep track of sub-processes started by BufferManager   
@@ -125,9 +437,13 @@ class BufferMan(object):
        - provides all acquired data to manageDataBufer 
        - count number of events and calculate life time
 
+       in rapid-block mode, NCaptures events are read from the device
+       at once and stored in consecutive buffers
+
        Arg: funtion handling data acquisition from device
 
-    Communicates with consumer via multiprocessing.Queue()
+    Publishes events to manageDataBuffer by advancing the head cursor 
+    of the ring buffer in shared memory
 
     '''
 #    self.prlog('*==* BufMan:  !!! acquireData starting')
@@ -135,47 +451,73 @@ class BufferMan(object):
 
     ni = 0       # temporary variable
     ts = time.time()
+    tend = ts    # end of last read-out
   
-    ibufw = -1   # buffer index
+    N = self.NCaptures  # number of events per read-out
     while self.ACTIVE.value:
+      # wait for free buffer(s) and for running status
+      full = self.head.value - self.minCursor() > self.NBuffers - N
+      if full: tw = time.time()
+      self.prodWakeup.wait(lambda: not self.ACTIVE.value or 
+        (self.head.value - self.minCursor() <= self.NBuffers - N
+         and self.RUNNING.value) )
+      if full and self.RUNNING.value: # buffer was full, count and time
+        self.NbufFull.value += 1
+        self.TbufFull.value += time.time() - tw
+      if not self.ACTIVE.value: 
+        if self.verbose: self.prlog('*==* BufMan.acquireData()  ended')
+        return
   # sample data from Picoscope handled by instance ps
-      ibufw = (ibufw + 1) % self.NBuffers # next write buffer
-      while ibufw==self.ibufr.value:  # wait for consumer done with this buffer
-        if not self.ACTIVE.value: 
-          if self.verbose: self.prlog ('*==* BufMan.acquireData()  ended')
-          return
-        time.sleep(0.0005)
-#
-      while not self.RUNNING.value:   # wait for running status 
-        if not self.ACTIVE.value: 
-          if self.verbose: self.prlog('*==* BufMan.acquireData()  ended')
-          return
-        time.sleep(0.01)
+      ibufws = [(self.head.value + k) % self.NBuffers for k in range(N)]
+      for ibufw in ibufws:
+        self.CslotSeq[ibufw] = -1 # invalidate slot for zero-copy readers
 
 # data acquisition from hardware
-      e = self.rawDAQproducer(self.BMbuf[ibufw])
+      if N == 1:
+        e = self.rawDAQproducer(self.BMbuf[ibufws[0]])
+      else:
+        e = self.rawDAQproducer([self.BMbuf[i] for i in ibufws])
       if e == None: 
         if self.verbose: self.prlog('*==* BufMan.acquireData()  ended')
         return
-      ttrg, tl = e
-      tlife += tl
+      ttrgs, tl = e[:2]
+      flags = e[2] if len(e) > 2 else 0 # optional, from device
+      if N == 1: 
+        ttrgs = [ttrgs]
+        flags = [flags]
+      elif np.isscalar(flags): 
+        flags = [flags] * N
+      tlife += tl   # life time accounted per read-out
       self.Tlife.value += tl
-      ttrg -= self.BMT0.value
-      self.timeStamp[ibufw] = ttrg  # store time when data became ready
-      self.Ttrig.value = ttrg
-      self.Ntrig.value += 1
-      self.trigStamp[ibufw]=self.Ntrig.value
-      self.prod_Que.put( ibufw )
-       
-# wait for free buffer       
-      while self.prod_Que.qsize() == self.NBuffers:
-        if not self.ACTIVE.value: 
-          if self.verbose: self.prlog('*==* BufMan.acquireData()  ended')
-          return
-        time.sleep(0.0005)
+      t = time.time()
+      tdead = [max(0., t - tend - tl)] + [0.]*(N-1) # for whole read-out
+      tend = t
+      if self.Timing: 
+        tf = time.time()
+      for k, (ibufw, ttrg) in enumerate(zip(ibufws, ttrgs)):
+        if self.Timing:
+          self.CtReady[ibufw] = ttrg
+          self.CtFilled[ibufw] = tf
+          self.latency.fill(0, tf - ttrg)
+        ttrg -= self.BMT0.value
+        self.Ttrig.value = ttrg
+        self.Ntrig.value += 1
+        # store header: event number, time when data became ready, ...
+        self.header[ibufw] = (self.Ntrig.value, ttrg, tdead[k], flags[k])
+        if self.Features: 
+          self.computeFeatures(ibufw) # once, before event is published
+        self.CslotSeq[ibufw] = self.head.value
+        if self.Timing:
+          tp = time.time()
+          self.CtPublish[ibufw] = tp
+          self.latency.fill(1, tp - tf)
+        self.head.value += 1   # publish event (producer is the only writer)
+      self.mgrWakeup.notify()
+      for c in range(self.NclientSlots.value):
+        self.clientWakeups[c].notify()
       
 # calculate life time and read rate
-      if (self.Ntrig.value - ni) == 10:
+      if (self.Ntrig.value - ni) >= 10:
         dt = time.time()-ts
         ts += dt
         self.readrate.value = (self.Ntrig.value-ni)/dt
@@ -192,65 +534,102 @@ class BufferMan(object):
     '''main Consumer Thread 
 
        - receive data from procuder (acquireData):
-       - provide all events for analysis to "obligatory" consumers
        - provide subset of events to "random" consumers (picoVMeter, oscilloscope)
 
+       obligatory consumers read events directly via their cursors
+
     '''
     t0=time.time()
     n0=0
     n=0
+    gen = -1      # generation of client registry
+    clients = []  # active clients
+    mpQs = []     # active mpQ consumers
+    mpQcount = [0] * self.MaxClients   # events since last offer, prescaling
+    mpQtlast = [0.] * self.MaxClients  # time of last delivery, rate limit
     while self.ACTIVE.value:
-      while self.prod_Que.empty(): # wait for pointer to data in producer queue
-        if not self.ACTIVE.value:
-          if self.verbose: self.prlog('*==* BufMan ended')
-          return
-        time.sleep(0.0005)
-      self.ibufr.value = self.prod_Que.get()
-      evNr = self.trigStamp[self.ibufr.value]
-      evTime=self.timeStamp[self.ibufr.value]
+      # wait for next event published by producer
+      self.mgrWakeup.wait(lambda: not self.ACTIVE.value or
+                          self.tail.value < self.head.value)
+      if not self.ACTIVE.value: break
+      seq = self.tail.value
+      ibufr = seq % self.NBuffers
+      evNr = self.trigStamp[ibufr]
+      evTime=self.timeStamp[ibufr]
+
+# clients attached or detached ?
+      if self.registryGen.value != gen:
+        gen = self.registryGen.value
+        clients = [i for i in range(self.MaxClients) if self.CclientUsed[i]]
+        newQs = [i for i in range(self.MaxClients) 
+                 if self.CmpQused[i] and i not in mpQs]
+        for i in newQs:
+          mpQcount[i] = 0
+          mpQtlast[i] = 0.
+        mpQs = [i for i in range(self.MaxClients) if self.CmpQused[i]]
  
 # check if other threads or sup-processes request data
-#     next request treated as "done" for obligatory consumers
-      l_obligatory=[]
-      if len(self.request_Ques):
-        for i, Q in enumerate(self.request_Ques):
+      if len(clients):
+        for i in clients:
+          Q = self.request_Ques[i]
           if not Q.empty():
             req = Q.get()
-            if req==0:                          # return poiner to Buffer      
-              self.consumer_Ques[i].put( self.ibufr.value ) 
-              l_obligatory.append(i)
-            elif req==1:                               # return a copy of data
-              self.consumer_Ques[i].put( (evNr, evTime, 
-                    self.BMbuf[self.ibufr.value]) ) 
-            elif req==2:                   # return copy and mark as obligatory
+            if req==1:                                 # return a copy of data
               self.consumer_Ques[i].put( (evNr, evTime, 
-                      BMbuf[self.ibufr.value]) ) 
-              l_obligatory.append(i)
+                    self.toVolts(self.BMbuf[ibufr]) ) ) 
+            elif req==3:                  # return reference to slot (zero-copy)
+              self.consumer_Ques[i].put( (evNr, evTime, ibufr, seq) )
             else:
               self.prlog('!=! manageDataBuffer: invalid request mode', req)
               sys.exit(1)
+            if self.Timing:
+              self.latency.fill(3 + i, time.time() - self.CtPublish[ibufr])
               
 # provide data via a mp-Queue at lower priority 
-      if len(self.mpQues):
+      if len(mpQs):
 ###                 only if Buffer is not full
-#      if len(self.mpQues) and self.prod_Que.qsize() <= self.NBuffers/2 :
-        for Q in self.mpQues:
-          if Q.empty(): # put an event in the Queue
-            Q.put( (evNr, evTime, self.BMbuf[self.ibufr.value] ) )
-
-# wait until all obligatory consumers are done
-      if len(l_obligatory):
-        while self.ACTIVE.value:
-          done = True
-          for i in l_obligatory:
-            if self.request_Ques[i].empty(): done = False
-          if done: break
-          if not self.ACTIVE.value: 
-            if self.verbose: self.prlog('*==* BufMan ended')
-            return
-          time.sleep(0.0005)        
-#  signal to producer that all consumers are done with this event
-      self.ibufr.value = -1
+#      if len(self.mpQues) and 
+#         self.head.value - self.tail.value <= self.NBuffers/2 :
+        tev = time.time()
+        for iq in mpQs:
+          # cheap checks first: prescale and rate limit
+          mpQcount[iq] += 1
+          if mpQcount[iq] < self.CmpQprescale[iq]: continue
+          dtmin = self.CmpQdtmin[iq]
+          if dtmin and tev - mpQtlast[iq] < dtmin: continue
+          mpQcount[iq] = 0
+          Q = self.mpQues[iq]
+          if not Q.empty(): # consumer busy
+            if not self.CmpQlatest[iq]: 
+              self.CmpQdrop[iq] += 1
+              continue
+            try: # replace event not yet read
+              Q.get_nowait()
+              self.CmpQdeliv[iq] -= 1
+              self.CmpQdrop[iq] += 1
+            except Empty:
+              pass
+          try: # never block, item may still be in transit to consumer
+            if self.CmpQfeat[iq]: 
+              Q.put( (evNr, evTime, self.features[ibufr].copy()), False)
+            elif self.CmpQzc[iq]: 
+              Q.put( (evNr, evTime, ibufr, seq), False)
+            else:
+              Q.put( (evNr, evTime, self.toVolts(self.BMbuf[ibufr]) ), False)
+          except Full:
+            self.CmpQdrop[iq] += 1
+            continue
+          self.CmpQdeliv[iq] += 1
+          mpQtlast[iq] = tev
+          if self.Timing:
+            self.latency.fill(3 + 2*self.MaxClients + iq, 
+                              time.time() - self.CtPublish[ibufr])
+
+#  signal to producer that manager is done with this event
+      if self.Timing:
+        self.latency.fill(2, time.time() - self.CtPublish[ibufr])
+      self.tail.value += 1
+      self.prodWakeup.notify()
 
 # print event rate
       n+=1
@@ -274,36 +653,140 @@ class BufferMan(object):
     ''' 
     register a client to Buffer Manager
 
+      may be called at any time, also while a run is active,
+      and from any process started by the process owning BufferMan 
+
     Returns: client index
     '''
 
     self.BMlock.acquire() # called by many processes, needs protection ...  
-    self.request_Ques.append(Queue(1))
-    self.consumer_Ques.append(Queue(1))
-    client_index=len(self.request_Ques)-1
+    free = [i for i in range(self.MaxClients) if not self.CclientUsed[i]]
+    if not len(free):
+      self.BMlock.release()
+      self.prlog('!=! BMregister: maximum number of clients reached')
+      sys.exit(1)
+    client_index = free[0]
+    for Q in (self.request_Ques[client_index], 
+              self.consumer_Ques[client_index]):
+      self._drain(Q) # left-over from previous client
+    self.Cgating[client_index] = 0 # joins at first request of an event
+    self.Cheld[client_index] = 0
+    self.CclientUsed[client_index] = 1
+    self.NclientSlots.value = max(self.NclientSlots.value, client_index+1)
+    self.registryGen.value += 1
     self.BMlock.release()
   
     if self.verbose:
       self.prlog("*==* BMregister: new client id=%i" % client_index)
     return client_index
 
-  def BMregister_mpQ(self):
+  def BMjoin(self, client_indices):
+    ''' 
+    make registered clients obligatory consumers starting at the 
+    next event, without waiting for their first request;
+    all clients in the list start at the same event, i.e. the next
+    event of the first client if this is already an obligatory 
+    consumer (no events lost)
+    '''
+    self.BMlock.acquire()
+    c0 = client_indices[0]
+    start = self.Ccursor[c0] if self.Cgating[c0] else self.head.value
+    for c in client_indices:
+      self.Ccursor[c] = start
+      self.Cheld[c] = 0
+      self.Cgating[c] = 1
+    self.BMlock.release()
+
+  def BMunregister(self, client_index):
+    ''' 
+    detach a client from Buffer Manager, 
+      obligatory clients no longer hold back data acquisition
+    '''
+    self.BMlock.acquire()
+    self.Cgating[client_index] = 0
+    self.Cheld[client_index] = 0
+    self.CclientUsed[client_index] = 0
+    self.registryGen.value += 1
+    self.BMlock.release()
+    self.prodWakeup.notify()
+    if self.verbose:
+      self.prlog("*==* BMunregister: client id=%i detached" % client_index)
+
+  def _drain(self, Q):
+    '''remove items from a Queue'''
+    try:
+      while True: Q.get_nowait()
+    except Empty:
+      pass
+
+  def BMregister_mpQ(self, zerocopy=None, policy='drop', prescale=1, 
+                     maxRate=0., features=False):
 #   multiprocessing Queue
     ''' 
     register a subprocess to Buffer Manager
     
     copy of data will be transferred via a multiprocess Queue
+
+    Args: 
+      zerocopy: only pass reference to buffer slot through Queue,
+                default from configuration key ZeroCopy 
+      policy: 'drop': event is dropped if consumer is busy
+              'latest': event replaces the one not yet read by consumer
+      prescale: only every n-th event is offered to the consumer
+      maxRate: maximum rate (Hz) of events offered, 0. for no limit
+      features: pass features of event (array of BMfeatureType, one
+                entry per channel) instead of event data, needs 
+                configuration key Features
     
     Returns: client index
-             multiprocess Queue
+             multiprocess Queue (or BMslotQue if zerocopy)
     '''
 
-    self.mpQues.append( Queue(1) )
-    cid=len(self.mpQues)-1
+    if policy not in ('drop', 'latest'):
+      self.prlog('!=! BMregister_mpQ: invalid policy ' + str(policy))
+      sys.exit(1)
+    if features and not self.Features:
+      self.prlog('!=! BMregister_mpQ: features requested, but not configured')
+      sys.exit(1)
+    if zerocopy is None: zerocopy = self.ZeroCopy
+    if features: zerocopy = False
+    self.BMlock.acquire()
+    free = [i for i in range(self.MaxClients) if not self.CmpQused[i]]
+    if not len(free):
+      self.BMlock.release()
+      self.prlog('!=! BMregister_mpQ: maximum number of clients reached')
+      sys.exit(1)
+    cid = free[0]
+    self._drain(self.mpQues[cid]) # left-over from previous client
+    self.CmpQzc[cid] = zerocopy
+    self.CmpQlatest[cid] = (policy == 'latest')
+    self.CmpQprescale[cid] = max(int(prescale), 1)
+    self.CmpQdtmin[cid] = 1./maxRate if maxRate > 0. else 0.
+    self.CmpQdeliv[cid] = 0
+    self.CmpQdrop[cid] = 0
+    self.CmpQfeat[cid] = features
+    self.CmpQused[cid] = 1
+    self.registryGen.value += 1
+    self.BMlock.release()
   
     if self.verbose:
       self.prlog("*==* BMregister_mpQ: new subprocess client id=%i" % cid)
-    return cid, self.mpQues[-1]
+    if zerocopy:
+      return cid, BMslotQue(self.mpQues[cid], self.CBMbuf, self.CslotSeq,
+                  self.BMbuf.shape, self.BMdtype, self.VScale, self.VOffset)
+    return cid, self.mpQues[cid]
+
+  def BMunregister_mpQ(self, client_index):
+    ''' 
+    detach a subprocess registered with BMregister_mpQ()
+    '''
+    self.BMlock.acquire()
+    self.CmpQused[client_index] = 0
+    self.registryGen.value += 1
+    self.BMlock.release()
+    if self.verbose:
+      self.prlog("*==* BMunregister_mpQ: client id=%i detached" 
+                 % client_index)
 
 # -- encapsulates data access for obligatory and random clients  
   def getEvent(self, client_index, mode=1):
@@ -316,26 +799,241 @@ class BufferMan(object):
         mode:   0: event pointer (olbigatory consumer)
                 1: copy of event data (random consumer)
                 2: copy of event (olbigatory consumer)
+                3: event pointer (random consumer, zero-copy);
+                   use isValid() to check that the event was not 
+                   overwritten by the producer while in use
+
+      Event pointers refer to raw ADC samples if the buffer is configured
+      with RawData: true, use toVolts() to get physical units; event 
+      copies are always in Volts.
+
+      Obligatory consumers keep the event until the next call 
+      of getEvent(); random consumers are served by manageDataBuffer.
+      A client should not mix obligatory and random modes.  
 
       Returns: 
 
         event data
     '''
 
+    if mode == 0 or mode == 2: 
+      e = self.nextEvents(client_index, 1)
+      if e is None: return
+      ibr, k = e
+      evNr = self.trigStamp[ibr]
+      evTime = self.timeStamp[ibr]
+      if mode == 0:
+        evData = self.BMbuf[ibr]
+      elif self.RawData:
+        evData = self.toVolts(self.BMbuf[ibr]) # new array in Volts
+      else:
+        evData = np.array(self.BMbuf[ibr])
+      return evNr, evTime, evData
+
     self.request_Ques[client_index].put(mode)
     cQ=self.consumer_Ques[client_index]
-    while cQ.empty():
+    while True: # block until Buffer Manager answers
       if not self.ACTIVE.value: return
-      time.sleep(0.0005)
+      try:
+        e = cQ.get(True, self.syncTimeout)
+        break
+      except Empty:
+        pass
     #self.prlog('*==* getEvent: received event %i'%evNr)
-    if mode !=0: # received copy of the event data
-      return cQ.get()
-    else: # received pointer to event buffer
-      ibr = cQ.get()
-      evNr = self.trigStamp[ibr]
-      evTime = self.timeStamp[ibr]
-      evData = self.BMbuf[ibr]
-      return evNr, evTime, evData
+    if mode == 3: # received reference to slot in shared buffer
+      evNr, evTime, ibr, seq = e
+      self.evRefs[client_index] = (ibr, seq) 
+      return evNr, evTime, self.BMbuf[ibr]
+    else: # received copy of the event data
+      return e
+
+  def getEvents(self, client_index, n, timeout=0.1):
+    ''' 
+    request a block of consecutive events (obligatory consumer)
+
+      returns as soon as n events are ready, or with the events ready 
+      when the time-out expires; the block is limited by the number of
+      buffers and ends at the last buffer slot, so that it is 
+      contiguous in memory. All events are held by the client and
+      released at once with the next call of getEvents().
+
+      Arguments: 
+
+        client_index: index as returned by BMregister()
+        n: maximum number of events
+        timeout: maximum time (s) to wait for n events
+
+      Returns: 
+
+        evNrs: array of k event numbers
+        evTimes: array of k event times
+        evData: view of event data, shape (k, NChannels, NSamples)
+    '''
+    e = self.nextEvents(client_index, n, timeout)
+    if e is None: return
+    ibr, k = e
+    return (self.trigStamp[ibr:ibr+k], self.timeStamp[ibr:ibr+k], 
+            self.BMbuf[ibr:ibr+k])
+
+  def getHeaders(self, client_index):
+    ''' 
+    headers of the events held by an obligatory consumer
+
+      Returns: 
+
+        view of structured array (type BMheaderType) with fields
+        evNr, tTrig, tDead and flags, one entry per event
+        returned by the last call of getEvent() or getEvents() 
+    '''
+    ibr = self.Ccursor[client_index] % self.NBuffers
+    return self.header[ibr:ibr + self.Cheld[client_index]]
+
+  def getFeatures(self, client_index):
+    ''' 
+    features of the events held by an obligatory consumer, or of the
+    last event obtained with getEvent(mode=3) by a random consumer 
+    (check with isValid() after use)
+
+      Returns: 
+
+        view of structured array (type BMfeatureType) with fields 
+        baseline, mean, rms, min, max, peak and integral, 
+        shape (number of events, NChannels) for obligatory consumers,
+        (NChannels) for random consumers; 
+        None if not configured (configuration key Features)
+    '''
+    if not self.Features: return
+    c = client_index
+    if self.Cgating[c]:
+      ibr = self.Ccursor[c] % self.NBuffers
+      return self.features[ibr:ibr + self.Cheld[c]]
+    ibr, seq = self.evRefs[c]
+    return self.features[ibr]
+
+  def computeFeatures(self, ibuf):
+    '''
+    features of event in buffer slot ibuf, vectorized over channels;
+    computed from samples as stored (raw ADC counts or Volts) and 
+    converted to Volts, stored in shared memory next to the slot
+    '''
+    x = self.BMbuf[ibuf]
+    f = self.features[ibuf]
+    NS = self.NSamples
+    s = x.sum(axis=1, dtype=np.float64)
+    s2 = np.einsum('ij,ij->i', x, x, dtype=np.float64)
+    base = x[:, :self.NBaseline].sum(axis=1, dtype=np.float64)/self.NBaseline
+    xmin, xmax = x.min(axis=1), x.max(axis=1)
+    mean = s / NS
+    if self.RawData: # V = raw * a - b
+      a, b = self.VScale[:, 0], self.VOffset[:, 0]
+    else:
+      a, b = 1., 0.
+    f['baseline'] = a * base - b
+    f['mean'] = a * mean - b
+    f['rms'] = np.sqrt(np.maximum(a*a * s2/NS - 2.*a*b * mean + b*b, 0.))
+    f['min'] = a * xmin - b
+    f['max'] = a * xmax - b
+    f['peak'] = np.where(xmax - base >= base - xmin, 
+                         x.argmax(axis=1), x.argmin(axis=1))
+    f['integral'] = a * (s - NS * base) * self.TSampling
+
+  def nextEvents(self, client_index, n=1, timeout=None):
+    '''
+    advance read cursor of an obligatory consumer
+
+      release events held by client and wait for next one(s);
+      on first call, the client starts at the next event produced
+
+      Arguments: 
+
+        client_index: index as returned by BMregister()
+        n: number of events to hold, at most
+        timeout: maximum time (s) to wait for more than one event
+    
+      Returns:
+
+        index of first buffer slot held by the client, 
+        number of events held, 
+        None if BufferMan no longer active
+    '''
+    c = client_index
+    if not self.Cgating[c]: # first request, start at next event
+      self.Ccursor[c] = self.head.value
+      self.Cheld[c] = 0
+      self.Cgating[c] = 1
+    elif self.Cheld[c]:  # client is done with previous event(s)
+      self.releaseEvents(c)
+    ibr = self.Ccursor[c] % self.NBuffers
+    n = min(n, self.NBuffers - ibr) # contiguous block of slots
+    wakeup = self.clientWakeups[c]
+    wakeup.wait(lambda: not self.ACTIVE.value or 
+                self.head.value > self.Ccursor[c])
+    if n > 1 and self.head.value - self.Ccursor[c] < n:
+      tmax = None if timeout is None else time.time() + timeout 
+      wakeup.wait(lambda: not self.ACTIVE.value or 
+                  self.head.value - self.Ccursor[c] >= n, tmax)
+    if not self.ACTIVE.value: return
+    k = min(n, self.head.value - self.Ccursor[c])
+    self.Cheld[c] = k
+    if self.Timing:
+      td = time.time()
+      self.CtDeliver[c] = td
+      for i in range(ibr, ibr + k):
+        self.latency.fill(3 + c, td - self.CtPublish[i])
+    return ibr, k
+
+  def releaseEvents(self, client_index):
+    '''
+    release events held by an obligatory consumer without 
+    waiting for the next one (done implicitly by the next request)
+    '''
+    c = client_index
+    if not self.Cheld[c]: return
+    if self.Timing:
+      self.latency.fill(3 + self.MaxClients + c, 
+                        time.time() - self.CtDeliver[c])
+    self.Ccursor[c] += self.Cheld[c]
+    self.Cheld[c] = 0
+    self.prodWakeup.notify()
+
+  def toVolts(self, evData, out=None):
+    '''
+    convert event data to Volts
+
+      vectorized over channels (and events, if a block of events is given);
+      data in Volts are returned unchanged
+
+      Arguments:
+
+        evData: array of shape ([n,] NChannels, NSamples)
+        out: float32 array of same shape to store result, optional
+
+      Returns:
+      
+        event data in Volts
+    '''
+    if not self.RawData: return evData
+    out = np.multiply(evData, self.VScale, out=out, dtype=np.float32)
+    return np.subtract(out, self.VOffset, out=out)
+
+  def minCursor(self):
+    '''sequence number of oldest event still in use'''
+    m = self.tail.value
+    for c in range(self.NclientSlots.value):
+      if self.Cgating[c] and self.Ccursor[c] < m: 
+        m = self.Ccursor[c]
+    return m
+
+  def isValid(self, client_index):
+    '''
+    check event obtained with getEvent(mode=3) 
+ 
+      Returns: 
+
+        False if the buffer slot was overwritten in the meantime
+    '''
+    ibr, seq = self.evRefs[client_index]
+    return self.CslotSeq[ibr] == seq
 
 #-- Run control fuctions
 # set-up Buffer Manager processes
@@ -374,21 +1072,69 @@ class BufferMan(object):
             maxBMrate, self.BMIinterval) ) )
 #             max_rate   update_interval
 
-  # waveform display 
-    if 'mpOsci' in self.BMmodules: 
-      OScidx, OSmpQ = self.BMregister_mpQ()
-      self.procs.append(Process(name='Osci', target = mpOsci, 
-        args=(OSmpQ, self.DevConf.OscConfDict, 100., 'event rate') ) )
-#                                            interval
 # start BufferMan background processes   
     for prc in self.procs:
 #      prc.deamon = True
       prc.start()
       if self.verbose:
         print('      BufferMan: starting process ', prc.name, ' PID =', prc.pid)
+
+  # waveform display 
+    if 'mpOsci' in self.BMmodules: 
+      self.startOsci()
+  # event server for external subscribers
+    if self.EventServer:
+      self.startServer(self.EventServer)
+  # record all events to run file
+    if self.RecordFile:
+      datetime=time.strftime('%y%m%d-%H%M',time.localtime())
+      self.startRecorder(self.RecordFile + '_' + datetime + '.pdaq',
+                         self.RecordCompression)
 #  end start()
 
-# start run - this must not be started before all clients have registred
+  def startRecorder(self, fileName, compression=None):
+    '''record all events to binary run file, see BMrecorder.py'''
+    cid = self.BMregister()
+    self.BMjoin([cid]) # obligatory consumer from now on, no event missed
+    self.recStop = Event()
+    self.recDone = Event()
+    self.procs.append(Process(name='BMrecorder', target = mpBMrecorder, 
+      args=(self, cid, fileName, compression, None, 
+            self.recStop, self.recDone) ) )
+    self.procs[-1].start()
+    if self.verbose:
+      print('      BufferMan: starting process ', self.procs[-1].name, 
+            ' PID =', self.procs[-1].pid, ' file', fileName)
+
+  def stopRecorder(self, timeout=10.):
+    '''record remaining events, then close run file'''
+    if self.recStop is None: return
+    self.recStop.set()
+    if not self.recDone.wait(timeout):
+      self.prlog('!=! BufferMan: run file not closed in time')
+    self.recStop = None
+
+  def startServer(self, path):
+    '''publish events on Unix-domain socket path, see BMserver.py'''
+    self.procs.append(Process(name='BMserver', target = mpBMserver, 
+      args=(self, path) ) )
+    self.procs[-1].start()
+    if self.verbose:
+      print('      BufferMan: starting process ', self.procs[-1].name, 
+            ' PID =', self.procs[-1].pid, ' socket', path)
+
+  def startOsci(self):
+    '''start waveform display, also possible while running'''
+    OScidx, OSmpQ = self.BMregister_mpQ(maxRate=10.) # display interval
+    self.procs.append(Process(name='Osci', target = mpOsci, 
+      args=(OSmpQ, self.DevConf.OscConfDict, 100., 'event rate') ) )
+#                                          interval
+    self.procs[-1].start()
+    if self.verbose:
+      print('      BufferMan: starting process ', self.procs[-1].name, 
+            ' PID =', self.procs[-1].pid)
+
+# start run - clients may register before or while running
   def run(self):
     # start manageDataBuffer process and initialize run 
     if self.runStarted:
@@ -415,6 +1161,7 @@ class BufferMan(object):
         
     self.runStarted = True
     self.RUNNING.value = True  
+    self.prodWakeup.notify()
 
 # pause data acquisition - RUNNING flag evaluated by raw data producer
   def pause(self):
@@ -440,6 +1187,7 @@ class BufferMan(object):
 
     if self.verbose: self.prlog('*==* BufferMan  resume')
     self.RUNNING.value = True
+    self.prodWakeup.notify()
     self.dTPause += (time.time() - self.tPause)  
     self.tPause = 0.
 
@@ -456,6 +1204,8 @@ class BufferMan(object):
       self.stop()
     elif c =='E': 
       self.end()
+    elif c == 'O':
+      self.startOsci()
 
   def kbdin(self):
     ''' 
@@ -470,7 +1220,8 @@ class BufferMan(object):
 
     while self.ACTIVE.value:
       self.kbdtxt =\
-       get_input(30*' '+'type -> E(nd), P(ause), S(top) or R(esume) + <ret> ')
+       get_input(30*' '+
+         'type -> E(nd), P(ause), S(top), R(esume) or O(sci) + <ret> ')
 
   def kbdCntrl(self):
     ''' 
@@ -523,17 +1274,30 @@ class BufferMan(object):
   def getStatus(self):
     ''' Returns:
           tuple: Running status, number of events,
-                 time of last event, rate, life fraction and buffer level
+                 time of last event, rate, life fraction and buffer level,
+                 dictionary with additional information 
+                 (e.g. gaps and overlaps of data stream, latencies
+                 per stage of data flow if Timing is enabled)
     '''
-    bL = (self.prod_Que.qsize()*100)/self.NBuffers
+    bL = ((self.head.value - self.minCursor())*100)/self.NBuffers
     stat = self.RUNNING.value
     if self.tPause != 0. :
       t = self.tPause
     else:
       t = time.time()
+    info = {}
+    if hasattr(self.DevConf, 'Streaming') and self.DevConf.Streaming:
+      info.update(self.DevConf.streamStatus())
+    if self.Timing:
+      info['latency'] = self.latency.summary()
+    info['bufFull'] = self.NbufFull.value
+    mpQs = [i for i in range(self.MaxClients) if self.CmpQused[i]]
+    if len(mpQs):  # delivered and dropped events per mpQ consumer
+      info['mpQ'] = dict((i, (self.CmpQdeliv[i], self.CmpQdrop[i])) 
+                         for i in mpQs)
     return (stat, t - self.BMT0.value - self.dTPause, 
            self.Ntrig.value, self.Ttrig.value, self.Tlife.value, 
-           self.readrate.value, self.lifefrac.value, bL) 
+           self.readrate.value, self.lifefrac.value, bL, info) 
 
 # mp-Qeueu for information, starts getStatus as thread  
   def getBMInfoQue(self):
@@ -587,9 +1351,54 @@ class BufferMan(object):
     self.prlog('  Trun=%.1fs  Ntrig=%i  Tlife=%.1fs\n'\
           %(self.TStop - self.BMT0.value - self.dTPause, 
             self.Ntrig.value, self.Tlife.value) )
+    self.prlog('  NBuffers=%i  buffer full: %i read-outs, %.1fs'\
+          %(self.NBuffers, self.NbufFull.value, self.TbufFull.value) )
+    r = self.recommendNBuffers()
+    if r is not None: self.prlog('  ' + r)
+    if self.Timing:
+      self.prlog('  latencies per stage (entries, p50, p99 in ms):')
+      for name, (n, p50, p99) in self.latency.summary().items():
+        self.prlog('    %-12s %9i %9.3g %9.3g'%(name, n, p50*1E3, p99*1E3))
     self.flog.close()
     self.flog = None
 
+  def recommendNBuffers(self):
+    '''
+    check whether the buffer was too small during the run
+
+      buffer space is allocated in shared memory before sub-processes
+      are started, so the depth can only be changed for the next run;
+      the recommended depth holds the events the producer would have
+      read during the mean waiting time for a free buffer, i.e. mean
+      stall time x producer rate, with a factor two as headroom
+
+      Returns: 
+
+        recommendation (text) or None if buffer size was adequate
+    '''
+    Trun = time.time() - self.BMT0.value - self.dTPause
+    if self.TStop: Trun = self.TStop - self.BMT0.value - self.dTPause
+    Nr = self.Ntrig.value / self.NCaptures # number of read-outs
+    if Trun <= 0. or Nr == 0 or self.NbufFull.value < 0.01*Nr:
+      return None # buffer full for less than 1% of read-outs
+    fFull = self.NbufFull.value / Nr
+    if fFull > 0.5: # permanently full, not only during bursts 
+      return ('!!! buffer full in %.0f%% of read-outs:'%(fFull*100.) + 
+        ' consumers too slow, a larger buffer will not help') 
+    # producer rate while not waiting, and mean waiting time
+    Tprod = Trun - self.TbufFull.value
+    rProd = self.Ntrig.value / Tprod if Tprod > 0. else self.readrate.value
+    tStall = self.TbufFull.value / self.NbufFull.value
+    NRec = self.NBuffers + int(2. * rProd * tStall) + self.NCaptures
+    if self.NBuffers >= self.maxNBuffers:
+      return ('!!! buffer full in %i read-outs:'%(self.NbufFull.value) +
+        ' increase BufferMemory')
+    if NRec > self.maxNBuffers:
+      return ('!!! buffer full in %i read-outs:'%(self.NbufFull.value) +
+        ' need NBuffers: %i, increase BufferMemory'%(NRec) )
+    return ('!!! buffer full in %i read-outs:'%(self.NbufFull.value) + 
+      ' recommend NBuffers: %i'%(NRec) )
+
 # put run in "stopped state" - BM processes remain active, no resume possible    
   def stop(self):
     if not self.ACTIVE.value:
@@ -607,6 +1416,7 @@ class BufferMan(object):
     self.STOPPED = True
 
     time.sleep(1.) # allow all events to propagate 
+    self.stopRecorder()
 
     if self.verbose: 
       self.prlog('*==* BufferMan ending - reached stopped state')
@@ -626,6 +1436,7 @@ class BufferMan(object):
 
     if self.RUNNING.value: # ending from RUNNING state, stop first
       self.stop()
+    self.stopRecorder() # if ending from paused state 
 
     self.ACTIVE.value = False 
     time.sleep(0.3)
@@ -133,9 +133,14 @@ class VoltMeter(object):
     for i, C in enumerate(self.ChanNams):
       if i > 1: 
         break  # works for 2 channels only
-      self.V[i] = np.sqrt (np.inner(evData[i], evData[i])/len(evData[i]) )
+      if evData.dtype.names: # features computed by BufferMan
+        f = evData[i]
+        self.V[i] = f['rms']
+        self.stdV[i] = np.sqrt(max(f['rms']**2 - f['mean']**2, 0.))
+      else:
+        self.V[i] = np.sqrt (np.inner(evData[i], evData[i])/len(evData[i]) )
+        self.stdV[i] = evData[i].std()
       self.Vhist[i, k] = self.V[i]
-      self.stdV[i] = evData[i].std()
       self.stdVhist[i, k] = self.stdV[i]
     # update history graph
       if n>1: # !!! fix to avoid permanent display of first object in blit mode
@@ -24,6 +24,7 @@ __version__ = _version_info._get_version_string()
 
 # Import components to be callabel at package level
 __all__ = ["BufferMan","mpBufManCntrl","mpOsci","mpRMeter","mpVMeter",
-        "mpBDisplay","mpHists", "DataLogger", "mpDataGraphs", "mpDataLogger"]
+        "mpBDisplay","mpHists", "DataLogger", "mpDataGraphs", "mpDataLogger",
+        "BMserver", "BMrecorder", "picoReplay", "sharedHists"]
 
 
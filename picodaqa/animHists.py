@@ -7,11 +7,15 @@ from __future__ import unicode_literals
 import time, numpy as np
 import matplotlib.pyplot as plt
 import itertools
+from .sharedHists import sharedHists
 
 class animHists(object):
   ''' display histogram, as normalised frequency distibutions
 
       requency distribution of a scalar quantity
+
+      input per call is either a list of arrays of new values, or 
+      a sharedHists object holding the bin contents
   '''
 
   def __init__(self, Hdescr, name='Histograms'):
@@ -92,6 +96,7 @@ class animHists(object):
       else:                         # linear y scale
         self.axes[ih].set_ylim(0., self.ymxs[ih]/self.nbins[ih])
         self.frqs.append(np.zeros(self.nbins[ih]))
+    self.frq0s = [f.copy() for f in self.frqs] # empty histograms
     
   def init(self):
     self.rects = []
@@ -110,21 +115,28 @@ class animHists(object):
     return grobjs # return tuple of graphics objects
 
   def __call__(self, vals):
-    # add recent values to frequency array, input is a list of arrays
+    # update frequency arrays, input is a list of arrays of new values
+    #   or histograms in shared memory
     for ih in range(self.nHist):
-      vs = vals[ih]
-      self.entries[ih] += len(vs)
-      for v in vs:
-        iv = int(self.nbins[ih] * (v-self.mins[ih]) / (self.maxs[ih]-self.mins[ih]))
-        if iv >=0 and iv < self.nbins[ih]:
-          self.frqs[ih][iv]+=1
-      if(len(vs)):
-        norm = np.sum(self.frqs[ih]) # normalisation to one
+      if isinstance(vals, sharedHists):
+        counts, n = vals.get(ih)
+        if n == self.entries[ih]: continue # nothing new
+        self.entries[ih] = n
+        self.frqs[ih] = self.frq0s[ih] + counts
+      else:
+        vs = np.asarray(vals[ih], dtype=np.float64)
+        if not len(vs): continue
+        self.entries[ih] += len(vs)
+        ib = np.floor(self.nbins[ih] * (vs-self.mins[ih]) 
+                      / (self.maxs[ih]-self.mins[ih]))
+        ib = ib[(ib >= 0) & (ib < self.nbins[ih])].astype(np.intp)
+        self.frqs[ih] += np.bincount(ib, minlength=self.nbins[ih])
+      norm = np.sum(self.frqs[ih]) # normalisation to one
     # set new heights for histogram bars
-        for rect, frq in zip(self.rects[ih], self.frqs[ih]):
-          rect.set_height(frq/norm)
+      for rect, frq in zip(self.rects[ih], self.frqs[ih]/norm):
+        rect.set_height(frq)
     # update text
-        self.animtxts[ih].set_text('Entries: %i'%(self.entries[ih]) )
+      self.animtxts[ih].set_text('Entries: %i'%(self.entries[ih]) )
 
     return tuple(self.animtxts)  \
         + tuple(itertools.chain.from_iterable(self.rects) ) 
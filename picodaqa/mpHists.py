@@ -7,7 +7,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import sys, time, numpy as np
+import sys, time, itertools, numpy as np
 
 import matplotlib
 matplotlib.use('TkAgg')
@@ -19,7 +19,9 @@ from .animHists import *
 def mpHists(Q, Hdescripts, interval, name = 'Histograms'):
   ''' show animated histogram(s)
     Args:
-      Q:    multiprocessing.Queue() 
+      Q:    sharedHists object, histograms in shared memory filled
+            by producer and redrawn every interval ms, or 
+            multiprocessing.Queue() transporting lists of values
       Hdescripts:  list of histogram descriptors, where each 
         descriptor is itself a list: [min, max, nbins, ymax, name, type]
           min: minimum value
@@ -52,8 +54,12 @@ def mpHists(Q, Hdescripts, interval, name = 'Histograms'):
   try:
     H = animHists(Hdescripts, name)
     figH = H.fig
+    if isinstance(Q, sharedHists): # read from shared memory at frame rate
+      frames = lambda: itertools.repeat(Q)
+    else:
+      frames = yieldData_fromQ
 # set up matplotlib animation
-    HAnim = anim.FuncAnimation(figH, H, yieldData_fromQ, 
+    HAnim = anim.FuncAnimation(figH, H, frames, 
                         init_func=H.init, interval=interval, blit=True,
                         fargs=None, repeat=True,
                                # cache_frame_data=False #! no with old mpl)
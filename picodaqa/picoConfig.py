@@ -2,7 +2,13 @@
 from __future__ import print_function, division, unicode_literals
 from __future__ import absolute_import
 
-import numpy as np, time, sys, importlib
+import numpy as np, time, sys, importlib, threading
+from ctypes import CFUNCTYPE, c_void_p, c_int16, c_int32, c_uint32
+from multiprocessing.sharedctypes import RawValue, RawArray
+
+# call-back of driver in streaming mode, as ps4000aStreamingReady
+streamingReadyType = CFUNCTYPE(c_void_p, c_int16, c_int32, c_uint32, 
+                               c_int16, c_uint32, c_int16, c_int16, c_void_p)
 
 class PSconfig(object):
   '''set PicoScope configuration'''
@@ -91,6 +97,33 @@ class PSconfig(object):
       self.trgTO=confdict["trgTO"] 
     else:
       self.trgTO=1000             #  and time-out
+    if "NCaptures"  in confdict: 
+      self.NCaptures=confdict["NCaptures"] # events per read-out 
+    else:
+      self.NCaptures=1            #  > 1 for rapid-block mode
+# streaming mode: gap-less data, delivered as frames of Nsamples
+    if "Streaming"  in confdict: 
+      self.Streaming=confdict["Streaming"] 
+    else:
+      self.Streaming=False
+    # streaming interface of pico-python only implemented for ps4000a,
+    #   other models have stubs of the low-level functions
+    if self.Streaming and self.PSmodel not in ('4000a', 'sim'):
+      print('!!! PSconfig: no streaming mode for device ' + self.PSmodel)
+      print('  - exiting')
+      sys.exit(1)
+    if "streamOverlap"  in confdict: 
+      self.streamOverlap=confdict["streamOverlap"] # samples shared by frames
+    else:
+      self.streamOverlap=0
+    if "streamChunk"  in confdict: 
+      self.streamChunk=confdict["streamChunk"] # samples per driver call-back
+    else:
+      self.streamChunk=10000
+    if "streamBuffer"  in confdict: 
+      self.streamBuffer=confdict["streamBuffer"] # samples in ring per channel
+    else:
+      self.streamBuffer=1000000
 # configuration of AWG
     if "swpSG" in confdict: 
       self.swpSG=confdict["swpSG"]
@@ -132,26 +165,36 @@ class PSconfig(object):
 
     if "mode" in confdict: 
       self.mode = confdict["mode"] # "VMeter" "test"
+
+# parameters of emulated device (PSmodel: sim), see picoSim.py
+    if "simConfig" in confdict: 
+      self.simConfig = confdict["simConfig"]
+    else:
+      self.simConfig = {}
 # - end PSconf.__init__()
 
   def init(self):
 # configuration parameters only known after initialisation
+    if self.PSmodel == 'sim': # emulated device, no hardware needed
+      from .picoSim import PSsim
+      self.picoDevice = PSsim(self.simConfig)
+    else:
     # import libraries relevant to PS model
-    try:
-      ps_module = importlib.import_module('picoscope.ps' + self.PSmodel)
-    except Exception as e:
-      print('!!! PSconfig:  Error loading driver library ps'+self.PSmodel)
-      print(str(e))
-      print('  - exiting')
-      sys.exit(1)
-    try:
-      ps_class = getattr(ps_module, 'PS' + self.PSmodel)
-      self.picoDevice = ps_class()
-    except Exception as e:
-      print('!!! PSconfig:  Error initialising device')
-      print(str(e))
-      print('  - exiting')
-      sys.exit(1)
+      try:
+        ps_module = importlib.import_module('picoscope.ps' + self.PSmodel)
+      except Exception as e:
+        print('!!! PSconfig:  Error loading driver library ps'+self.PSmodel)
+        print(str(e))
+        print('  - exiting')
+        sys.exit(1)
+      try:
+        ps_class = getattr(ps_module, 'PS' + self.PSmodel)
+        self.picoDevice = ps_class()
+      except Exception as e:
+        print('!!! PSconfig:  Error initialising device')
+        print(str(e))
+        print('  - exiting')
+        sys.exit(1)
 
     self.TSampling = 0.
     self.NSamples = 0.
@@ -211,12 +254,12 @@ class PSconfig(object):
       print(prompt+"number of samples = %d (%d)" % (NSamples, self.Nsamples))
       #print("  > maximum samples = %d" % maxSamples)
 # 2) Channel Ranges
-      CRanges=[]
-      for i, Chan in enumerate(self.picoChannels):
-        CRanges.append(self.picoDevice.setChannel(Chan, self.ChanModes[i], 
-                   self.ChanRanges[i], VOffset=self.ChanOffsets[i], 
-                   enabled=True, BWLimited=False) )
-        if verbose>0:
+    CRanges=[]
+    for i, Chan in enumerate(self.picoChannels):
+      CRanges.append(self.picoDevice.setChannel(Chan, self.ChanModes[i], 
+                 self.ChanRanges[i], VOffset=self.ChanOffsets[i], 
+                 enabled=True, BWLimited=False) )
+      if verbose>0:
           print(prompt+"range channel %s: %.3gV (%.3gV)" \
           %(self.picoChannels[i], CRanges[i], self.ChanRanges[i]))
           print(prompt+"channel offset %s: %.3gV"\
@@ -244,27 +287,188 @@ class PSconfig(object):
             %(self.swpSG, self.stopFreqSG, self.dwellTimeSG) )
 
     self.setSamplingPars(TSampling, NSamples, CRanges) # store in config class
+    # conversion of raw samples to Volts:  V = raw * scale - offset
+    self.rawScale = []
+    self.rawOffset = []
+    for C in self.picoChannels:
+      so = self.picoDevice.getScaleAndOffset(C)
+      self.rawScale.append(so['scale'])
+      self.rawOffset.append(so['offset'])
+    self.VScale = np.array(self.rawScale, dtype=np.float32).reshape(-1, 1)
+    self.VOffset = np.array(self.rawOffset, dtype=np.float32).reshape(-1, 1)
     # reserve static buffer for picoscope driver for storing raw data
     self.rawBuf = np.empty([self.NChannels, NSamples], dtype=np.int16 )
 
+# 5) rapid-block mode: segmented device memory, several triggers per run
+    if self.NCaptures > 1:
+      maxSamples = self.picoDevice.memorySegments(self.NCaptures)
+      if maxSamples < NSamples:
+        print('!!! PSconfig: too many captures (%i) for %i samples'\
+              %(self.NCaptures, NSamples) )
+        print('  - exiting')
+        sys.exit(1)
+      self.picoDevice.setNoOfCaptures(self.NCaptures)
+      self.rawBufRB = np.empty([self.NChannels, self.NCaptures, NSamples], 
+                               dtype=np.int16 )
+      if verbose>0:
+        print(prompt+"rapid-block mode: %i captures per read-out"\
+              %(self.NCaptures) )
+
+# 6) streaming mode: ring buffer for continuous data from driver
+    if self.Streaming:
+      if self.streamOverlap >= NSamples:
+        print('!!! PSconfig: stream overlap (%i) must be smaller than'\
+              %(self.streamOverlap) + ' frame size (%i)'%(NSamples) )
+        print('  - exiting')
+        sys.exit(1)
+      self.streamBuffer = max(self.streamBuffer, 
+                              2*(self.streamChunk + NSamples))
+      self.CstreamRing = RawArray('h', self.NChannels * self.streamBuffer)
+      self.streamRing = np.frombuffer(self.CstreamRing, 'h').reshape(
+                          self.NChannels, self.streamBuffer)
+      self.streamChunks = np.empty([self.NChannels, self.streamChunk], 
+                                   dtype=np.int16 )
+      self.streamWrite = RawValue('q', 0) # samples written to ring
+      self.streamRead = 0                 # start of next frame
+      self.streamT0 = 0.                  # time of first sample 
+      self.NstreamGaps = RawValue('i', 0)    # number of gaps in stream
+      self.NstreamLost = RawValue('q', 0)    # samples lost in gaps 
+      self.NstreamOverlap = RawValue('q', 0) # samples delivered twice
+      self.NstreamOverflow = RawValue('i', 0) # chunks with ADC overflow
+      self.streamCond = threading.Condition()
+      self.streamActive = False
+      if verbose>0:
+        print(prompt+"streaming mode: frames of %i samples, overlap %i"\
+              %(NSamples, self.streamOverlap) )
+
     # estimate set-up and transfer-overhead
     #     from maximum rate with free-running trigger
-    self.toverhead = 0.00038 + self.NChannels * 0.00013
+    if self.PSmodel == 'sim': # no set-up time of emulated device
+      self.toverhead = 0.
+    else:
+      self.toverhead = 0.00038 + self.NChannels * 0.00013
 
 # -- end def picoIni
 
+  def startStreaming(self):
+    '''
+    start continuous data taking of device, 
+      driver chunks are collected in ring buffer by a background thread 
+    '''
+    dev = self.picoDevice
+    for i, C in enumerate(self.picoChannels):
+      dev._lowLevelSetDataBuffer(dev.CHANNELS[C], self.streamChunks[i], 0, 0)
+    self.streamCallback = streamingReadyType(self.streamReady) 
+    dT = int(round(self.TSampling*1E9)) # sampling interval in ns
+    dev._lowLevelRunStreaming(dT, dev.TIME_UNITS['nanoseconds'], 0, 
+       self.streamChunk, 0, 1, 0, self.streamChunk)
+    self.streamT0 = time.time()
+    self.streamActive = True
+    thr = threading.Thread(target=self.pollStreaming)
+    thr.daemon = True
+    thr.start()
+
+  def pollStreaming(self):
+    '''background thread: fetch data from driver'''
+    tpoll = 0.25 * self.streamChunk * self.TSampling
+    while self.streamActive:
+      self.picoDevice._lowLevelGetStreamingLatestValues(self.streamCallback)
+      time.sleep(tpoll)
+
+  def streamReady(self, handle, noOfSamples, startIndex, overflow,
+                  triggerAt, triggered, autoStop, pParameter):
+    '''driver call-back: copy new data to ring buffer'''
+    if noOfSamples <= 0: return
+    L = self.streamBuffer
+    iw = self.streamWrite.value % L
+    n1 = min(noOfSamples, L - iw)
+    chunk = self.streamChunks[:, startIndex:startIndex+noOfSamples]
+    self.streamRing[:, iw:iw+n1] = chunk[:, :n1]
+    if n1 < noOfSamples: 
+      self.streamRing[:, :noOfSamples-n1] = chunk[:, n1:]
+    if overflow: self.NstreamOverflow.value += 1
+    with self.streamCond:
+      self.streamWrite.value += noOfSamples
+      self.streamCond.notify()
+
+  def acquireStreamFrame(self, buffer):
+    '''
+    next frame of NSamples from data stream, consecutive frames
+      overlap by streamOverlap samples; if the ring buffer was 
+      overwritten before the frame was read, the lost samples 
+      are skipped and counted as a gap 
+
+      Args:
+        buffer: space to store data, raw ADC samples if dtype is int16,
+                Volts otherwise
+
+      Returns:
+        ttrg: time of first sample of frame
+        tlife: time span of new samples in frame (no dead time)
+        flags: 0x100 if there was a gap before the frame
+    '''
+    if not self.streamActive: 
+      self.startStreaming()
+    L = self.streamBuffer
+    NS = self.NSamples
+    flags = 0
+    while True:
+      with self.streamCond: # wait for complete frame
+        while self.streamWrite.value < self.streamRead + NS:
+          if hasattr(self, 'BM') and not self.BM.ACTIVE.value: return None
+          self.streamCond.wait(0.1)
+      lost = self.streamWrite.value - L - self.streamRead 
+      if lost > 0: # data overwritten, skip to oldest complete sample 
+        self.streamRead += lost + self.streamChunk 
+        self.NstreamGaps.value += 1
+        self.NstreamLost.value += lost + self.streamChunk
+        flags = 0x100
+        continue
+      ir = self.streamRead % L
+      n1 = min(NS, L - ir)
+      if buffer.dtype == np.int16:
+        buffer[:, :n1] = self.streamRing[:, ir:ir+n1]
+        buffer[:, n1:] = self.streamRing[:, :NS-n1]
+      else:
+        np.multiply(self.streamRing[:, ir:ir+n1], self.VScale, 
+                    out=buffer[:, :n1])
+        np.multiply(self.streamRing[:, :NS-n1], self.VScale, 
+                    out=buffer[:, n1:])
+        np.subtract(buffer, self.VOffset, out=buffer)
+      if self.streamWrite.value - L <= self.streamRead: 
+        break # not overwritten while copying
+    ttrg = self.streamT0 + self.streamRead * self.TSampling
+    self.streamRead += NS - self.streamOverlap
+    self.NstreamOverlap.value += self.streamOverlap 
+    return ttrg, (NS - self.streamOverlap) * self.TSampling, flags
+
+  def streamStatus(self):
+    '''
+    Returns: 
+      dictionary with number of gaps, lost samples, 
+      overlapping samples and chunks with ADC overflow 
+    '''
+    return {'gaps': self.NstreamGaps.value, 
+            'lost': self.NstreamLost.value,
+            'overlap': self.NstreamOverlap.value,
+            'overflows': self.NstreamOverflow.value}
+
   def acquireDataBM(self, buffer):
     '''
     read data from device
       this part is hardware (i.e. driver) specific code for PicoScope device,
       interfaces to BufferMan.py 
       Args:
-        buffer: space to store data
+        buffer: space to store data, raw ADC samples if dtype is int16,
+                Volts otherwise
 
       Returns:
         ttrg: time when device became ready
         tlife life time of device
+        flags: ADC overflow, one bit per channel
   '''
+    if self.Streaming: 
+      return self.acquireStreamFrame(buffer)
     if self.pretrig != 0.:
       self.picoDevice.runBlock(pretrig=self.pretrig) #
     else:
@@ -276,16 +480,72 @@ class PSconfig(object):
     # waiting time for occurence of trigger is counted as life time
     ttrg=time.time()
     # account life time, w. appr. corr. for set-up time
-    tlife = ttrg - ti - self.toverhead
+    tlife = max(0., ttrg - ti - self.toverhead)
+    flags = 0
+    if buffer.dtype == np.int16: 
+  # store raw data directly in buffer, conversion left to consumers
+      for i, C in enumerate(self.picoChannels):
+        _, _, ovf = self.picoDevice.getDataRaw(C, self.NSamples, 
+                                               data=buffer[i])
+        flags |= int(ovf) << self.picoDevice.CHANNELS[C] # bool per channel
+      return ttrg, tlife, flags
   # store raw data in global array 
     for i, C in enumerate(self.picoChannels):
-      self.picoDevice.getDataRaw(C, self.NSamples, data=self.rawBuf[i])
+      _, _, ovf = self.picoDevice.getDataRaw(C, self.NSamples, 
+                                             data=self.rawBuf[i])
+      flags |= int(ovf) << self.picoDevice.CHANNELS[C]
       self.picoDevice.rawToV(C, self.rawBuf[i], buffer[i], dtype=np.float32)
 # alternative:
      # self.picoDevice.getDataV(C, NSamples, dataV=VBuf[ibufw,i], dtype=np.float32)
-    return ttrg, tlife
+    return ttrg, tlife, flags
 # - end def acquireDataBM()
 
+  def acquireDataBMbulk(self, buffers):
+    '''
+    read data from device in rapid-block mode 
+      NCaptures triggers are recorded in segmented device memory and
+      transferred in one bulk read-out per channel; 
+      interfaces to BufferMan.py 
+
+      Args:
+        buffers: list of NCaptures spaces to store data, raw ADC samples
+                 if dtype is int16, Volts otherwise
+
+      Returns:
+        ttrgs: trigger times of the segments 
+        tlife: life time of device for the whole batch
+        flags: ADC overflow of the segments, one bit per channel
+  '''
+    if self.pretrig != 0.:
+      self.picoDevice.runBlock(pretrig=self.pretrig) #
+    else:
+      self.picoDevice.runBlock() #
+    ti=time.time()
+    while not self.picoDevice.isReady():
+      if not self.BM.ACTIVE.value: return None
+      time.sleep(0.0001)
+    # waiting time for all triggers is counted as life time
+    tready = time.time()
+    # account life time, w. appr. corr. for set-up time
+    tlife = max(0., tready - ti - self.toverhead)
+  # bulk transfer of all segments to global array 
+    flags = np.zeros(self.NCaptures, dtype=np.uint32)
+    for i, C in enumerate(self.picoChannels):
+      _, _, ovf = self.picoDevice.getDataRawBulk(C, self.NSamples, 0, 
+                       self.NCaptures-1, data=self.rawBufRB[i])
+      flags |= np.asarray(ovf, dtype=np.uint32)
+  # no absolute time stamps of segments from driver, 
+  #   distribute trigger times evenly over waiting time
+    ttrgs = ti + (tready - ti) * np.arange(1, self.NCaptures+1)/self.NCaptures
+    for k, buffer in enumerate(buffers):
+      if buffer.dtype == np.int16:
+        buffer[:] = self.rawBufRB[:, k]
+      else:
+        np.multiply(self.rawBufRB[:, k], self.VScale, out=buffer)
+        np.subtract(buffer, self.VOffset, out=buffer)
+    return ttrgs, tlife, flags
+# - end def acquireDataBMbulk()
+
   def acquireData(self, buffer):
     '''
     read data from device
@@ -298,6 +558,9 @@ class PSconfig(object):
         ttrg: time when device became ready
         tlife life time of device
   '''
+    if self.Streaming: 
+      e = self.acquireStreamFrame(buffer)
+      return e if e is None else e[:2]
     if self.pretrig !=0.:
       self.picoDevice.runBlock(pretrig=self.pretrig)
     else:  
@@ -308,7 +571,7 @@ class PSconfig(object):
     # waiting time for occurence of trigger is counted as life time
     ttrg=time.time()
     # account life time, w. appr. corr. for set-up time
-    tlife = ttrg - ti - self.toverhead
+    tlife = max(0., ttrg - ti - self.toverhead)
   # store raw data in global array 
     for i, C in enumerate(self.picoChannels):
       self.picoDevice.getDataRaw(C, self.NSamples, data=self.rawBuf[i])
@@ -324,6 +587,8 @@ class PSconfig(object):
     '''
     prompt = 4*' ' + 'PSconf: '
     if self.verbose: print(prompt + "closing connection to device")
+    if self.Streaming: 
+      self.streamActive = False
     self.picoDevice.stop()
     self.picoDevice.close()
     time.sleep(0.5)
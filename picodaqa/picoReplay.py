@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+  picoReplay: replay of recorded run files (see BMrecorder.py)
+
+  file-backed data source with the interface of picoConfig.PSconfig
+  as used by BufferMan, selected by "PSmodel: replay" in the device
+  configuration; parameters:
+
+    replayFile:  name of run file
+    replayMode:  'original' (timing as recorded), 'rate' (fixed
+                 rate) or 'max' (as fast as possible)
+    replayRate:  event rate (Hz) for mode 'rate'
+    replaySpeed: speed-up factor for mode 'original'
+    replayLoop:  start again at end of file
+    RawData:     BufferMan stores raw ADC samples (as in BMconfig)
+
+  the run file is memory-mapped, so that filling a buffer slot is a
+  single copy (or conversion to Volts, if BufferMan does not store
+  raw data).
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import sys, numpy as np, time
+from .BMrecorder import RunFileReader
+
+class PSreplay(object):
+  '''replay recorded events'''
+
+  def __init__(self, confdict=None):
+    if confdict==None: confdict={}
+    if "replayFile" in confdict:
+      self.replayFile = confdict["replayFile"]
+    else:
+      print('!!! PSreplay: no replayFile given')
+      self.replayFile = None
+    if "replayMode" in confdict:
+      self.replayMode = confdict["replayMode"]
+    else:
+      self.replayMode = 'original'
+    if "replayRate" in confdict:
+      self.replayRate = confdict["replayRate"]
+    else:
+      self.replayRate = 100.
+    if "replaySpeed" in confdict:
+      self.replaySpeed = confdict["replaySpeed"]
+    else:
+      self.replaySpeed = 1.
+    if "replayLoop" in confdict:
+      self.replayLoop = confdict["replayLoop"]
+    else:
+      self.replayLoop = False
+    if "RawData" in confdict:
+      self.RawData = confdict["RawData"]
+    else:
+      self.RawData = False
+    if "verbose" in confdict:
+      self.verbose = confdict["verbose"]
+    else:
+      self.verbose=1   # print (detailed) info if >0
+    self.PSmodel = 'replay'
+    self.NCaptures = 1
+    self.Streaming = False
+
+  def init(self):
+    self.reader = RunFileReader(self.replayFile)
+    rd = self.reader
+    self.NChannels = rd.NChannels
+    self.NSamples = rd.NSamples
+    self.TSampling = rd.TSampling
+    self.OscConfDict = rd.conf['OscConfDict']
+    self.picoChannels = self.OscConfDict['Channels'] \
+           if 'Channels' in self.OscConfDict else \
+             ['A', 'B', 'C', 'D'][:self.NChannels]
+    self.CRanges = self.OscConfDict['CRanges'] \
+           if 'CRanges' in self.OscConfDict else [1.] * self.NChannels
+    # trigger settings, as used by analysis (e.g. pulseFilter)
+    for k, v in (('trgChan', self.picoChannels[0]), ('pretrig', 0.),
+                 ('trgActive', True), ('ChanColors', None)):
+      setattr(self, k, self.OscConfDict[k] if k in self.OscConfDict else v)
+    # conversion of raw data to Volts, as for PicoScope device
+    if rd.VScale is not None:
+      self.rawScale = rd.VScale.ravel().tolist()
+      self.rawOffset = rd.VOffset.ravel().tolist()
+    else:
+      self.rawScale = None
+      self.rawOffset = None
+      if self.RawData:
+        print('!!! PSreplay: run file contains Volts, set RawData: false')
+        print('  - exiting')
+        sys.exit(1)
+    if self.verbose:
+      print('      PSreplay: %i events from %s, mode %s'\
+            %(rd.NEvents, self.replayFile, self.replayMode) )
+    self._rewind()
+
+  def _rewind(self):
+    self.ichunk = 0
+    self.iev = 0
+    self.headers, self.data = self.reader.chunk(0)
+    self.t0 = None # start of replay
+
+  def setBufferManagerPointer(self, BM):
+    self.BM = BM
+
+  def _next(self):
+    '''advance to next event, Returns: False at end of file'''
+    if self.iev < len(self.headers): return True
+    self.ichunk += 1
+    if self.ichunk >= self.reader.NChunks:
+      if not self.replayLoop: return False
+      self._rewind()
+      return True
+    self.headers, self.data = self.reader.chunk(self.ichunk)
+    self.iev = 0
+    return True
+
+  def _wait(self, h):
+    # wait until event is due
+    t = time.time()
+    if self.t0 is None: # first event
+      self.t0 = t
+      self.tTrig0 = h['tTrig']
+      self.tnext = t
+    if self.replayMode == 'original':
+      tev = self.t0 + (h['tTrig'] - self.tTrig0) / self.replaySpeed
+      if tev < t - 1.: # behind, e.g. after pause: re-synchronize
+        self.t0 += t - tev
+        tev = t
+    elif self.replayMode == 'rate':
+      tev = max(self.tnext + 1./self.replayRate, t)
+      self.tnext = tev
+    else:
+      return
+    if tev > t: time.sleep(tev - t)
+
+  def acquireDataBM(self, buffer):
+    '''
+    copy next event into buffer slot of BufferMan
+
+      Returns:
+        time of event, time spent waiting for it, flags as recorded
+        None at end of run file
+    '''
+    ti = time.time()
+    if not self._next():
+      if self.verbose: print('      PSreplay: end of run file')
+      return None
+    h = self.headers[self.iev]
+    self._wait(h)
+    evData = self.data[self.iev]
+    if buffer.dtype == evData.dtype:
+      np.copyto(buffer, evData)
+    else: # convert raw samples to Volts while copying
+      np.multiply(evData, self.reader.VScale, out=buffer)
+      np.subtract(buffer, self.reader.VOffset, out=buffer)
+    self.iev += 1
+    t = time.time()
+    return t, t - ti, int(h['flags'])
+
+  def acquireData(self, buffer):
+    '''as acquireDataBM(), without flags'''
+    e = self.acquireDataBM(buffer)
+    if e is None: return
+    return e[:2]
+
+  def closeDevice(self):
+    self.headers, self.data = None, None
+    self.reader.close()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+'''
+  picoSim: emulation of a PicoScope device without hardware
+
+  implements the subset of the pico-python interface used by
+  picoConfig.PSconfig (block, rapid-block and streaming mode);
+  selected by "PSmodel: sim" in the device configuration, with
+  parameters of the simulation given as dictionary "simConfig":
+
+    trgRate:  mean trigger rate (Hz), 0. for as fast as possible
+    noise:    noise level (rms in V)
+    pulse:    pulse shape, dictionary with taur, tauon, tauf (s)
+              and pheight (V) as in pulseFilter
+    pheightSpread: relative spread of pulse heights
+    pDouble:  probability for a second pulse in the same trace
+    tDouble:  mean time (s) of second pulse after first one
+    latency:  time for read-out of data per channel (s)
+    seed:     seed of random number generator
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import numpy as np, time
+
+class PSsim(object):
+  '''emulated PicoScope device'''
+
+  # same as pico-python for PS2000a series
+  CHANNELS = {"A": 0, "B": 1, "C": 2, "D": 3,
+              "External": 4, "MaxChannels": 4, "TriggerAux": 5}
+  CHANNEL_RANGE = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0,
+                   10.0, 20.0, 50.0]
+  TIME_UNITS = {"femtoseconds": 0, "picoseconds": 1, "nanoseconds": 2,
+                "microseconds": 3, "milliseconds": 4, "seconds": 5}
+  MAX_VALUE = 32512
+  MIN_VALUE = -32512
+  MAX_SAMPLES = 1 << 24 # device memory (samples)
+  TIMEBASE = 4E-9       # granularity of sampling interval
+
+  def __init__(self, confdict=None):
+    if confdict==None: confdict={}
+    if "trgRate" in confdict:
+      self.trgRate = confdict["trgRate"]
+    else:
+      self.trgRate = 100.
+    if "noise" in confdict:
+      self.noise = confdict["noise"]
+    else:
+      self.noise = 0.002
+    if "pulse" in confdict:
+      self.pulse = confdict["pulse"]
+    else:
+      self.pulse = {'taur': 20E-9, 'tauon': 12E-9, 'tauf': 128E-9,
+                    'pheight': -0.035}
+    if "pheightSpread" in confdict:
+      self.pheightSpread = confdict["pheightSpread"]
+    else:
+      self.pheightSpread = 0.2
+    if "pDouble" in confdict:
+      self.pDouble = confdict["pDouble"]
+    else:
+      self.pDouble = 0.
+    if "tDouble" in confdict:
+      self.tDouble = confdict["tDouble"]
+    else:
+      self.tDouble = 2.2E-6 # muon life time
+    if "latency" in confdict:
+      self.latency = confdict["latency"]
+    else:
+      self.latency = 0.
+    if "seed" in confdict:
+      seed = confdict["seed"]
+    else:
+      seed = None
+    self.rng = np.random.RandomState(seed)
+
+    self.TSampling = self.TIMEBASE
+    self.NSamples = 0
+    self.CHRange = [5.] * 4
+    self.CHOffset = [0.] * 4
+    self.CHEnabled = [False] * 4
+    self.trgActive = False
+    self.trgChan = 0
+    self.NCaptures = 1
+    self.tReady = 0.
+    self.events = [] # pulse times and heights for each capture
+    self.streamBuffers = {}
+
+  def getAllUnitInfo(self):
+    return 'PicoScope emulation (picodaqa.picoSim), trigger rate %.3g Hz'\
+        % (self.trgRate)
+
+  def getMaxValue(self):
+    return self.MAX_VALUE
+
+  def setSamplingInterval(self, sampleInterval, duration,
+                          oversample=0, segmentIndex=0):
+    self.TSampling = max(1, round(sampleInterval/self.TIMEBASE)) \
+                      * self.TIMEBASE
+    self.NSamples = int(round(duration / self.TSampling))
+    return (self.TSampling, self.NSamples, self.MAX_SAMPLES)
+
+  def setChannel(self, channel='A', coupling="AC", VRange=2.0,
+                 VOffset=0.0, enabled=True, BWLimited=0,
+                 probeAttenuation=1.0):
+    ch = self.CHANNELS[channel]
+    # choose next larger range, as real device
+    for r in self.CHANNEL_RANGE:
+      if r - VRange/probeAttenuation > -1E-4: break
+    self.CHRange[ch] = r * probeAttenuation
+    self.CHOffset[ch] = VOffset
+    self.CHEnabled[ch] = bool(enabled)
+    return self.CHRange[ch]
+
+  def setSimpleTrigger(self, trigSrc, threshold_V=0.0, direction='Rising',
+                       delay=0, timeout_ms=100, enabled=True):
+    self.trgActive = enabled
+    self.trgChan = self.CHANNELS[trigSrc] if trigSrc in self.CHANNELS else 0
+
+  def setSigGenBuiltInSimple(self, *args, **kwargs):
+    pass # signal generator not emulated
+
+  def getScaleAndOffset(self, channel):
+    ch = self.CHANNELS[channel]
+    return {'scale': self.CHRange[ch] / float(self.MAX_VALUE),
+            'offset': self.CHOffset[ch]}
+
+  def rawToV(self, channel, dataRaw, dataV=None, dtype=np.float64):
+    ch = self.CHANNELS[channel]
+    if dataV is None:
+      dataV = np.empty(dataRaw.shape, dtype=dtype)
+    np.multiply(dataRaw, self.CHRange[ch] / dtype(self.MAX_VALUE), dataV)
+    np.subtract(dataV, self.CHOffset[ch], dataV)
+    return dataV
+
+  def memorySegments(self, noSegments):
+    return self.MAX_SAMPLES // noSegments
+
+  def setNoOfCaptures(self, noCaptures):
+    self.NCaptures = noCaptures
+
+  def _pulses(self, t0, T, triggered):
+    '''pulse times and heights in trace starting at t0 with length T,
+       pulse at t0 for triggered device, random times otherwise'''
+    tp = []
+    if not triggered: # random arrival times
+      n = self.rng.poisson(self.trgRate * T)
+      tp = list(t0 + T * self.rng.random_sample(n))
+    else: # pulse at trigger position
+      tp = [t0]
+      if self.pDouble > 0. and self.rng.random_sample() < self.pDouble:
+        tp.append(t0 + self.rng.exponential(self.tDouble))
+    h = self.pulse['pheight'] * \
+       (1. + self.pheightSpread * self.rng.standard_normal(len(tp)))
+    return list(zip(tp, h))
+
+  def runBlock(self, pretrig=0.0, segmentIndex=0, callback=None):
+    T = self.NSamples * self.TSampling
+    t0 = pretrig * T # time of trigger in trace
+    tw = T
+    self.events = []
+    for i in range(self.NCaptures):
+      if self.trgActive and self.trgRate > 0.:
+        tw += self.rng.exponential(1./self.trgRate)
+      self.events.append(self._pulses(t0, T, self.trgActive))
+    self.tReady = time.time() + tw
+
+  def isReady(self):
+    return time.time() >= self.tReady
+
+  def stop(self):
+    self.streamBuffers = {}
+
+  def close(self):
+    pass
+
+  def getTriggerTimeOffset(self, segmentIndex=0):
+    return 0.
+
+  def _trace(self, ch, data, pulses, t0=0.):
+    '''fill data with noise and pulses in raw ADC counts, 
+       Returns: overflow bit of channel if trace exceeds ADC range'''
+    n = len(data)
+    V = self.noise * self.rng.standard_normal(n)
+    p = self.pulse
+    tr, ton, tf = p['taur'], p['tauon'], p['tauf']
+    for tp, h in pulses:
+      i0 = max(0, int((tp - t0)/self.TSampling))
+      i1 = min(n, int((tp - t0 + tr + ton + tf)/self.TSampling) + 1)
+      if i0 >= i1: continue
+      t = t0 + np.arange(i0, i1) * self.TSampling - tp
+      V[i0:i1] += h * np.clip(np.minimum(t/tr, (tr+ton+tf-t)/tf), 0., 1.)
+    V += self.CHOffset[ch]
+    V *= self.MAX_VALUE/self.CHRange[ch]
+    ovf = V.max() > self.MAX_VALUE or V.min() < self.MIN_VALUE
+    np.clip(V, self.MIN_VALUE, self.MAX_VALUE, out=V)
+    data[:] = V
+    if self.latency > 0.: time.sleep(self.latency)
+    return (1 << ch) if ovf else 0
+
+  def getDataRaw(self, channel='A', numSamples=0, startIndex=0,
+                 downSampleRatio=1, downSampleMode=0, segmentIndex=0,
+                 data=None):
+    if numSamples == 0: numSamples = self.NSamples
+    if data is None:
+      data = np.empty(numSamples, dtype=np.int16)
+    ovf = self._trace(self.CHANNELS[channel], data[:numSamples],
+                      self.events[segmentIndex])
+    return data, numSamples, bool(ovf) # as driver: overflow of this channel
+
+  def getDataRawBulk(self, channel='A', numSamples=0, fromSegment=0,
+                     toSegment=None, downSampleRatio=1, downSampleMode=0,
+                     data=None):
+    if toSegment is None: toSegment = self.NCaptures - 1
+    if numSamples == 0: numSamples = self.NSamples
+    if data is None:
+      data = np.empty((toSegment-fromSegment+1, numSamples), dtype=np.int16)
+    ovf = np.zeros(toSegment-fromSegment+1, dtype=np.uint32)
+    for i, seg in enumerate(range(fromSegment, toSegment+1)):
+      ovf[i] = self._trace(self.CHANNELS[channel], data[i, :numSamples],
+                           self.events[seg])
+    return data, numSamples, ovf
+
+# streaming mode, emulates low-level interface of pico-python (ps4000a)
+  def _lowLevelSetDataBuffer(self, channel, data, downSampleMode,
+                             segmentIndex):
+    self.streamBuffers[channel] = data
+
+  def _lowLevelRunStreaming(self, sampleInterval, sampleIntervalTimeUnits,
+        maxPreTriggerSamples, maxPostTriggerSamples, autoStop,
+        downSampleRatio, downSampleRatioMode, overviewBufferSize):
+    self.TSampling = sampleInterval * 10.**(3*sampleIntervalTimeUnits - 15)
+    self.streamChunk = overviewBufferSize
+    self.streamT0 = time.time()
+    self.streamNext = 0 # samples delivered so far
+    self.streamPulses = []
+
+  def _lowLevelGetStreamingLatestValues(self, lpPs4000Ready,
+                                        pParameter=None):
+    # samples accumulated since last call, at most one driver buffer
+    nTot = int((time.time() - self.streamT0) / self.TSampling)
+    n = min(nTot - self.streamNext, self.streamChunk)
+    if n <= 0: return
+    t0 = self.streamNext * self.TSampling
+    T = n * self.TSampling
+    # pulses of previous chunk may extend into this one
+    tp = self.pulse['taur'] + self.pulse['tauon'] + self.pulse['tauf']
+    pulses = [p for p in self.streamPulses if p[0] + tp > t0]
+    self.streamPulses = pulses + self._pulses(t0, T, False)
+    ovf = 0
+    for ch, data in self.streamBuffers.items():
+      ovf |= self._trace(ch, data[:n], self.streamPulses, t0)
+    self.streamNext += n
+    lpPs4000Ready(0, n, 0, ovf, 0, 0, 0, pParameter)
@@ -12,7 +12,8 @@ class plotBufManInfo(object):
 
         uses BufferMan InfoQue to display
         total number of events, data acquisition rate,
-        life time and buffer filling level
+        life time and buffer filling level, 
+        delivered/dropped events of mpQ consumers
   '''
 
 
@@ -27,11 +28,11 @@ class plotBufManInfo(object):
     self.xplt = np.linspace(-self.Npoints*self.interval, 0., self.Npoints)
 
   # create figure 
-    self.fig = plt.figure("BufManInfo", figsize=(5.,2.))
+    self.fig = plt.figure("BufManInfo", figsize=(5.,2.5))
     self.fig.subplots_adjust(left=0.05, bottom=0.25, right=0.925, top=0.95,
                wspace=None, hspace=.25)
-    self.axtext=plt.subplot2grid((7,1),(0,0), rowspan=2) 
-    self.axrate=plt.subplot2grid((7,1),(2,0), rowspan=5) 
+    self.axtext=plt.subplot2grid((7,1),(0,0), rowspan=3) 
+    self.axrate=plt.subplot2grid((7,1),(3,0), rowspan=4) 
 #    self.axtext.set_title('Buffer Manager Information')
     self.axtext.set_frame_on(False)
     self.axtext.get_xaxis().set_visible(False)
@@ -47,14 +48,16 @@ class plotBufManInfo(object):
   def init(self):
     self.line1, = self.axrate.plot(self.xplt, self.R, 
       marker = '.', markerfacecolor='b', linestyle='dashed', color='grey', )
-    self.animtxt1 = self.axtext.text(0.015, 0.65 , ' ',
+    self.animtxt1 = self.axtext.text(0.015, 0.75 , ' ',
               transform=self.axtext.transAxes, color='darkblue')
-    self.animtxt2 = self.axtext.text(0.2, 0.2 , ' ',
+    self.animtxt2 = self.axtext.text(0.2, 0.42 , ' ',
+              transform=self.axtext.transAxes, color='grey')
+    self.animtxt3 = self.axtext.text(0.2, 0.09 , ' ',
               transform=self.axtext.transAxes, color='grey')
     self.ro = 0.
     self.n0 = 0
     self.t0 = time.time()
-    return self.line1, self.animtxt1, self.animtxt2  
+    return self.line1, self.animtxt1, self.animtxt2, self.animtxt3
 
   def __call__(self, n):
     if n == 0:
@@ -62,10 +65,11 @@ class plotBufManInfo(object):
 
     k = n%self.Npoints
     try: 
-      RUNNING,TRun,Ntrig,Ttrig,Tlife,readrate,lifefrac,bufLevel = \
-                 self.Q.get(True, 0.5)
+      stat = self.Q.get(True, 0.5)
     except:
-      return self.line1, self.animtxt1, self.animtxt2  
+      return self.line1, self.animtxt1, self.animtxt2, self.animtxt3
+    RUNNING,TRun,Ntrig,Ttrig,Tlife,readrate,lifefrac,bufLevel = stat[:8]
+    info = stat[8] if len(stat) > 8 else {}
  
     self.R[k] = readrate
       
@@ -77,8 +81,17 @@ class plotBufManInfo(object):
     self.animtxt1.set_text( \
        'TRun: %.1fs  Triggers: %i  Lifetime: %.1fs (%.1f%%)'\
         %(TRun, Ntrig, Tlife, 100.*Tlife/TRun) + txtStat)
+    txtInfo = ''
+    if info.get('bufFull', 0):
+      txtInfo += '  full: %i' %(info['bufFull'])
+    if 'gaps' in info:
+      txtInfo += '  gaps: %i  overlap: %i' %(info['gaps'], info['overlap'])
     self.animtxt2.set_text( \
      'current rate: %.3gHz  life: %.1f%%  buffer: %.0f%%'\
-          %(readrate, lifefrac, bufLevel) )
+          %(readrate, lifefrac, bufLevel) + txtInfo)
+    if 'mpQ' in info: # delivered/dropped events per mpQ consumer
+      self.animtxt3.set_text('mpQ delivered/dropped: ' + 
+        '  '.join('%i: %i/%i'%(i, d, l) 
+                  for i, (d, l) in sorted(info['mpQ'].items())) )
 
-    return self.line1, self.animtxt1, self.animtxt2  
+    return self.line1, self.animtxt1, self.animtxt2, self.animtxt3  
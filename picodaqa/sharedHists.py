@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+'''
+.. module sharedHists of picoDAQ
+
+  histograms in shared memory, filled by a producer (e.g. an analysis
+  process) and displayed by another process (mpHists), which only
+  reads the bin contents at its own frame rate; no values are sent
+  through Queues
+'''
+
+from __future__ import print_function, division, unicode_literals
+from __future__ import absolute_import
+
+import math, numpy as np
+from multiprocessing.sharedctypes import RawArray
+
+class sharedHists(object):
+  '''
+  histograms with equidistant bins in shared memory
+
+  Each histogram must only be filled by one thread or process, so
+  no locking is needed; readers may see a histogram in the middle
+  of an update, which is harmless for display purposes.
+
+    Args:
+      Hdescr: list of histogram descriptors, where each descriptor
+        is a list itself: [min, max, nbins, ymax, name, type]
+        (see animHists)
+  '''
+
+  def __init__(self, Hdescr):
+    self.Hdescr = Hdescr
+    self.nHist = len(Hdescr)
+    self.mins = [float(h[0]) for h in Hdescr]
+    self.nbins = [int(h[2]) for h in Hdescr]
+    self.scales = [h[2] / (h[1] - h[0]) for h in Hdescr] # bins per unit
+    self.offsets = [0] + np.cumsum(self.nbins).tolist() # first bin in array
+    self.Chist = RawArray('q', self.offsets[-1]) # bin contents
+    self.Centries = RawArray('q', self.nHist)    # all values, incl. outside
+    self.hists = None  # numpy views, created in process using them
+
+  def _views(self):
+    h = np.frombuffer(self.Chist, 'q')
+    self.hists = [h[self.offsets[i]:self.offsets[i+1]]
+                  for i in range(self.nHist)]
+
+  def fill(self, ih, vals):
+    '''add value or array of values to histogram ih'''
+    if np.ndim(vals) == 0: # single value, no numpy overhead
+      self.Centries[ih] += 1
+      ib = math.floor((vals - self.mins[ih]) * self.scales[ih])
+      if 0 <= ib < self.nbins[ih]:
+        self.Chist[self.offsets[ih] + ib] += 1
+      return
+    if self.hists is None: self._views()
+    v = np.asarray(vals, dtype=np.float64).ravel()
+    if not len(v): return
+    self.Centries[ih] += len(v)
+    ib = np.floor((v - self.mins[ih]) * self.scales[ih])
+    ib = ib[(ib >= 0) & (ib < self.nbins[ih])].astype(np.intp)
+    self.hists[ih] += np.bincount(ib, minlength=self.nbins[ih])
+
+  def get(self, ih):
+    '''Returns: copy of bin contents and number of entries of histogram ih'''
+    if self.hists is None: self._views()
+    return np.array(self.hists[ih]), self.Centries[ih]
+
+  def reset(self):
+    if self.hists is None: self._views()
+    for ih in range(self.nHist):
+      self.hists[ih][:] = 0
+      self.Centries[ih] = 0